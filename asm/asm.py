@@ -14,20 +14,28 @@
 #  DB 12   ; a decimal byte
 #  DB 0b0001 ; a binary byte
 
+import io
+import os
 import sys
 import re
 
+# The binary image format is shared with the emulator
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ls8"))
+import image  # noqa: E402
+
 # Opcodes
 OPCODES = {
     "ADD":  {"type": 2, "code": "10100000"},
     "AND":  {"type": 2, "code": "10101000"},
     "CALL": {"type": 1, "code": "01010000"},
+    "CID":  {"type": 1, "code": "01001001"},
     "CMP":  {"type": 2, "code": "10100111"},
     "DEC":  {"type": 1, "code": "01100110"},
     "DIV":  {"type": 2, "code": "10100011"},
     "HLT":  {"type": 0, "code": "00000001"},
     "INC":  {"type": 1, "code": "01100101"},
     "INT":  {"type": 1, "code": "01010010"},
+    "IPI":  {"type": 2, "code": "10000110"},
     "IRET": {"type": 0, "code": "00010011"},
     "JEQ":  {"type": 1, "code": "01010101"},
     "JGE":  {"type": 1, "code": "01011010"},
@@ -52,6 +60,7 @@ OPCODES = {
     "SHR":  {"type": 2, "code": "10101101"},
     "ST":   {"type": 2, "code": "10000100"},
     "SUB":  {"type": 2, "code": "10100001"},
+    "TAS":  {"type": 2, "code": "10000101"},
     "XOR":  {"type": 2, "code": "10101011"},
 }
 
@@ -63,12 +72,30 @@ REGEX = r"(?:(\w+?):)?\s*(?:(\w+)\s*(?:(\w+)(?:\s*,\s*(\w+))?)?)?"
 REGEX_DS = r"(?:(\w+?):)?\s*DS\s*(.+)"  # insensitive
 REGEX_DB = r"(?:(\w+?):)?\s*DB\s*(.+)"  # insensitive
 
+# The patterns above, compiled once
+LINE_RE = re.compile(REGEX)
+DS_RE = re.compile(REGEX_DS, re.IGNORECASE)
+DB_RE = re.compile(REGEX_DB, re.IGNORECASE)
+REG_RE = re.compile(r"R([0-7])")
+
+# Opcode byte values
+CODES = {name: int(info["code"], 2) for name, info in OPCODES.items()}
+
+# Unflushed output the assembler lets build up before streaming it out
+FLUSH_BYTES = 4096
+
 
 def parse_commandline(argv):
     """
-    Usage: asm.py [inputfile] [outputfile]
+    Usage: asm.py [-O] [inputfile] [outputfile]
+
+    An outputfile ending in .ls8b gets a binary image instead of text.
+    -O runs the peephole optimizer.
     """
 
+    optimize = "-O" in argv
+    argv = [a for a in argv if a != "-O"]
+
     if len(argv) == 1:
         inputfile = "-"
         outputfile = "-"
@@ -82,10 +109,10 @@ def parse_commandline(argv):
         outputfile = argv[2]
 
     else:
-        print("usage: asm.py [infile.asm] [outfile.ls8]", file=sys.stderr)
+        print("usage: asm.py [-O] [infile.asm] [outfile.ls8]", file=sys.stderr)
         sys.exit(1)
 
-    return inputfile, outputfile
+    return inputfile, outputfile, optimize
 
 
 def open_files(inputfile, outputfile):
@@ -101,6 +128,8 @@ def open_files(inputfile, outputfile):
 
     if outputfile == "-":
         outputfile = sys.stdout
+    elif outputfile.endswith(".ls8b"):
+        outputfile = open(outputfile, "wb")
     else:
         outputfile = open(outputfile, "w")
 
@@ -112,144 +141,135 @@ def normalize_line(groups):
     Takes match groups and uppercases them if they're not None.
     """
 
-    result = []
-
-    for g in groups:
-        if g is None:
-            result.append(None)
-        else:
-            result.append(g.upper())
-
-    return result
+    return [None if g is None else g.upper() for g in groups]
 
 
 def p8(v):
     return "{:08b}".format(v)
 
 
-def pass1(inputfile, sym, code):
-    """
-    Pass 1
+# p8() of every byte value, for the text output
+BITS = [p8(v) for v in range(256)]
 
-    * Read the source code lines
-    * Parse labels, opcodes, and operands
-    * Record label offsets
-    * Emit machine code
-    """
+# Register names, so the common case skips the regex
+REGS = {f"R{n}": n for n in range(8)}
 
-    # Source line number
-    line_num = 0
 
-    # Current code address (for labels)
-    addr = 0
+class AsmError(ValueError):
+    """
+    Bad assembler input. `line` is the source line it was found on and
+    `status` the exit status asm.py reports it with.
+    """
 
-    def get_reg(op, fatal=True):
-        """Get a register number from a string, e.g. "R2" -> 2"""
+    def __init__(self, message, line, status=2):
+        super().__init__(f"line {line}: {message}")
+        self.line = line
+        self.status = status
 
-        nonlocal line_num
 
-        m = re.match(r"R([0-7])", op)
+class Assembler:
+    """
+    Single-pass assembler core.
+
+    * Source lines go in through feed() (or feed_all())
+    * Machine code is emitted straight into a bytearray
+    * Label references that aren't defined yet are recorded as fixups and
+      patched in as soon as the label shows up
+    * If an output stream is given, finished bytes are written to it in the
+      .ls8 text format as they become final, instead of all at the end
+    * With optimize=True the parsed lines are collected instead, run through
+      the peephole optimizer, and assembled at finish()
+    """
 
-        if m is None:
-            if fatal:
-                print(r"Line {line_num}: unknown register {op}",
-                      file=sys.stderr)
-                sys.exit(1)
-            else:
-                return None
+    def __init__(self, outputfile=None, optimize=False):
+        # Machine code and label addresses
+        self.code = bytearray()
+        self.sym = {}
 
-        return int(m.group(1))
+        # Forward references: symbol -> [(offset, line number), ...]
+        self.fixups = {}
 
-    def out0(opcode, op_a, op_b, machine_code):
-        """Handle opcodes with zero operands"""
+        # Text output annotations for bytes not yet written: offset -> comment,
+        # and offset -> label lines to write before that byte
+        self.comments = {}
+        self.label_lines = {}
 
-        nonlocal addr
+        self.outputfile = outputfile
+        self.flushed = 0
+        self.line_num = 0
 
-        code.append(f"{machine_code} # {opcode}")
-        addr += 1
+        # In optimizing mode lines are parsed into this list (see peephole.py)
+        # and only assembled in finish(), after the peephole pass
+        self.items = [] if optimize else None
+        self.report = None
 
-    def out1(opcode, op_a, op_b, machine_code):
-        """Handle opcodes with one operand"""
+    def error(self, message, status):
+        raise AsmError(message, self.line_num, status)
 
-        nonlocal addr
+    def get_reg(self, op):
+        """Get a register number from a string, e.g. "R2" -> 2"""
 
-        reg_a = get_reg(op_a)
-        code.append(f"{machine_code} # {opcode} {op_a}")
-        code.append(p8(reg_a))
-        addr += 2
+        if op in REGS:
+            return REGS[op]
 
-    def out2(opcode, op_a, op_b, machine_code):
-        """Handle opcodes with two operands"""
+        m = REG_RE.match(op)
 
-        nonlocal addr
+        if m is None:
+            self.error(f"unknown register {op}", 1)
 
-        reg_a = get_reg(op_a)
-        reg_b = get_reg(op_b)
+        return int(m.group(1))
 
-        code.append(f"{machine_code} # {opcode} {op_a},{op_b}")
-        code.append(p8(reg_a))
-        code.append(p8(reg_b))
+    def emit(self, value, comment=None):
+        """Append one byte, with an optional comment for the text output"""
 
-        addr += 3
+        if comment is not None and self.outputfile is not None:
+            self.comments[len(self.code)] = comment
 
-    def out8(opcode, op_a, op_b, machine_code):
-        """Handle LDI opcode (type 8)"""
+        self.code.append(value & 0xff)
 
-        nonlocal addr
+    def reference(self, name):
+        """Emit the address of a label, or a placeholder to patch later"""
 
-        reg_a = get_reg(op_a)
+        if name in self.sym:
+            self.emit(self.sym[name])
+        else:
+            self.fixups.setdefault(name, []).append((len(self.code), self.line_num))
+            self.emit(0)
 
-        try:
-            val_b = int(op_b, 0)
-            out_b = p8(val_b)
+    def define(self, label):
+        """Record a label at the current address and patch its waiting references"""
 
-        except ValueError:
-            # If it's not a value, it might be a symbol
-            out_b = f"sym:{op_b}"
+        addr = len(self.code)
+        self.sym[label] = addr
 
-        code.append(f"{machine_code} # {opcode} {op_a},{op_b}")
-        code.append(p8(reg_a))
-        code.append(out_b)
+        if self.outputfile is not None:
+            self.label_lines.setdefault(addr, []).append(f"# {label} (address {addr}):")
 
-        addr += 3
+        for offset, _ in self.fixups.pop(label, ()):
+            self.code[offset] = addr & 0xff
 
-    def handle_ds(line):
+    def handle_ds(self, line):
         """
         Handle DS pseudo-opcode
         """
 
-        nonlocal addr
-
-        m = re.match(REGEX_DS, line, re.IGNORECASE)
+        m = DS_RE.match(line)
 
         if m is None or m.group(2) is None:
-            print(f"line {line_num}: missing argument to DS", file=sys.stderr)
-            sys.exit(2)
+            self.error("missing argument to DS", 2)
 
-        data = m.group(2)
+        for ch in m.group(2):
+            self.emit(ord(ch), "[space]" if ch == ' ' else ch)
 
-        for i in range(len(data)):
-            print_char = data[i]
-
-            if print_char == ' ':
-                print_char = '[space]'
-
-            code.append(f"{p8(ord(data[i]))} # {print_char}")
-
-        addr += len(data)
-
-    def handle_db(line):
+    def handle_db(self, line):
         """
         Handle the DB pseudo-opcode
         """
 
-        nonlocal addr
-
-        m = re.match(REGEX_DB, line, re.IGNORECASE)
+        m = DB_RE.match(line)
 
         if m is None or m.group(2) is None:
-            print(f"line {line}: missing argument to DB", file=sys.stderr)
-            sys.exit(2)
+            self.error("missing argument to DB", 2)
 
         data = m.group(2)
 
@@ -257,64 +277,69 @@ def pass1(inputfile, sym, code):
             val = int(data, 0)
 
         except ValueError:
-            print(f"line {line_num}: invalid integer argument to DB",
-                  file=sys.stderr)
-            sys.exit(2)
+            self.error("invalid integer argument to DB", 2)
 
         # Force to byte size
-        val &= 0xff
+        self.emit(val & 0xff, data)
 
-        code.append(f"{p8(val)} # {data}")
-
-        addr += 1
-
-    def check_ops(opcode, op_a, op_b):
+    def check_ops(self, opcode, op_a, op_b):
         """Check operands for sanity with a particular opcode"""
 
-        def check_ops_count(desired, found):
-            # Makes sure we have right operand count
-            if found < desired:
-                print(f"Line {line_num}: missing operand to {opcode}",
-                      file=sys.stderr)
-                sys.exit(1)
-            elif found > desired:
-                print(f"Line {line_num}: unexpected operand to {opcode}",
-                      file=sys.stderr)
-                sys.exit(1)
-
         # Make sure we know this opcode at all
         if opcode not in OPCODES:
-            print(f"line {line_num}: unknown opcode {opcode}", file=sys.stderr)
-            sys.exit(2)
+            self.error(f"unknown opcode {opcode}", 2)
 
         op_type = OPCODES[opcode]["type"]
 
-        total_operands = 0
+        found = (op_a is not None) + (op_b is not None)
+
+        # 0, 1, or 2 register operands, or LDI r,i / LDI r,label
+        desired = 2 if op_type == 8 else op_type
+
+        # Makes sure we have right operand count
+        if found < desired:
+            self.error(f"missing operand to {opcode}", 1)
+        elif found > desired:
+            self.error(f"unexpected operand to {opcode}", 1)
 
-        if op_a is not None:
-            total_operands += 1
+        return op_type
 
-        if op_b is not None:
-            total_operands += 1
+    def instruction(self, opcode, op_a, op_b):
+        """Emit an opcode and its operands"""
 
-        if op_type == 0 or op_type == 1 or op_type == 2:
-            # 0, 1, or 2 register operands
-            check_ops_count(op_type, total_operands)
+        op_type = self.check_ops(opcode, op_a, op_b)
+
+        if op_type == 0:
+            self.emit(CODES[opcode], opcode)
+
+        elif op_type == 1:
+            reg_a = self.get_reg(op_a)
+            self.emit(CODES[opcode], f"{opcode} {op_a}")
+            self.emit(reg_a)
+
+        elif op_type == 2:
+            reg_a = self.get_reg(op_a)
+            reg_b = self.get_reg(op_b)
+            self.emit(CODES[opcode], f"{opcode} {op_a},{op_b}")
+            self.emit(reg_a)
+            self.emit(reg_b)
+
+        else:
+            # LDI: the immediate is a value, or a symbol to resolve
+            reg_a = self.get_reg(op_a)
+            self.emit(CODES[opcode], f"{opcode} {op_a},{op_b}")
+            self.emit(reg_a)
 
-        elif op_type == 8:
-            # LDI r,i or LDI r,label
-            check_ops_count(2, total_operands)
+            try:
+                self.emit(int(op_b, 0))
 
-    # Type to function mapping
-    type_f = {
-        0: out0,
-        1: out1,
-        2: out2,
-        8: out8,
-    }
+            except ValueError:
+                self.reference(op_b)
 
-    for line in inputfile:
-        line_num += 1
+    def feed(self, line):
+        """Assemble one source line"""
+
+        self.line_num += 1
 
         # Strip comments
         comment_index = line.find(';')
@@ -325,78 +350,179 @@ def pass1(inputfile, sym, code):
         line = line.strip()
 
         # Ignore blank lines
-        if input == '':
-            continue
-
-        # print(line)  # debug
+        if line == '':
+            return
 
-        m = re.match(REGEX, line)
+        m = LINE_RE.match(line)
 
-        if m is not None:
-            label, opcode, op_a, op_b = normalize_line(m.groups())
+        if m is None:
+            self.error(f"no match: {line}", 3)
 
-            # print(label, opcode, op_a, op_b)  # debug
+        label, opcode, op_a, op_b = normalize_line(m.groups())
 
-            # Track label address
+        if self.items is not None:
+            # Just record the line for the optimizer
             if label is not None:
-                sym[label] = addr
-                # print(f"Label {label}: {addr}")  # debug
-                code.append(f'# {label} (address {addr}):')
-
-            if opcode is not None:
-                if opcode == 'DS':
-                    handle_ds(line)
-                elif opcode == 'DB':
-                    handle_db(line)
-                else:
-                    # Check operand count
-                    check_ops(opcode, op_a, op_b)
-
-                    # Handle opcodes
-                    op_info = OPCODES[opcode]
-                    handler = type_f[op_info["type"]]
-                    handler(opcode, op_a, op_b, op_info["code"])
-        else:
-            print(f"No match: {input}", file=sys.stderr)
-            sys.exit(3)
+                self.items.append(("label", self.line_num, label))
+
+            if opcode == 'DS':
+                self.items.append(("ds", self.line_num, line))
+            elif opcode == 'DB':
+                self.items.append(("db", self.line_num, line))
+            elif opcode is not None:
+                self.items.append(("op", self.line_num, opcode, op_a, op_b))
+
+            return
+
+        # Track label address
+        if label is not None:
+            self.define(label)
+
+        if opcode is not None:
+            if opcode == 'DS':
+                self.handle_ds(line)
+            elif opcode == 'DB':
+                self.handle_db(line)
+            else:
+                self.instruction(opcode, op_a, op_b)
+
+        if self.outputfile is not None and len(self.code) - self.flushed >= FLUSH_BYTES:
+            self.flush()
+
+    def feed_all(self, inputfile):
+        for line in inputfile:
+            self.feed(line)
+
+    def flush(self, end=None):
+        """
+        Write out every byte that can no longer change: everything before the
+        oldest reference still waiting for its label.
+        """
+
+        if end is None:
+            end = len(self.code)
+
+            for refs in self.fixups.values():
+                end = min(end, refs[0][0])
+
+        code = self.code
+        comments = self.comments
+        label_lines = self.label_lines
+        out = []
+
+        for offset in range(self.flushed, end):
+            if offset in label_lines:
+                out.extend(label_lines.pop(offset))
+
+            comment = comments.pop(offset, None)
+
+            if comment is None:
+                out.append(BITS[code[offset]])
+            else:
+                out.append(f"{BITS[code[offset]]} # {comment}")
+
+        if out:
+            self.outputfile.write("\n".join(out) + "\n")
+
+        self.flushed = max(self.flushed, end)
+
+    def finish(self):
+        """
+        Check that every reference was resolved and write out the rest.
+        Returns the machine code.
+        """
+
+        if self.items is not None:
+            self.assemble_optimized()
+
+        for name, refs in self.fixups.items():
+            self.line_num = refs[0][1]
+            self.error(f"unknown symbol: {name}", 2)
+
+        if self.outputfile is not None:
+            self.flush()
+
+            # Labels after the last byte
+            for line in self.label_lines.pop(len(self.code), ()):
+                self.outputfile.write(f"{line}\n")
+
+        return self.code
 
 
-def pass2(outputfile, sym, code):
+    def assemble_optimized(self):
+        """Run the peephole pass over the collected lines and assemble the result"""
+
+        import peephole
+
+        items, self.report = peephole.optimize(self.items, OPCODES)
+        self.items = None
+
+        for item in items:
+            kind = item[0]
+            self.line_num = item[1]
+
+            if kind == "label":
+                self.define(item[2])
+            elif kind == "ds":
+                self.handle_ds(item[2])
+            elif kind == "db":
+                self.handle_db(item[2])
+            else:
+                self.instruction(*item[2:])
+
+
+def write_binary(outputfile, asm):
     """
-    Output the code, substituting in any symbols.
+    Output a binary image (see ls8/image.py) with the labels as its symbol table.
     """
 
-    for c in code:
-        # Replace symbols
-        if c[:4] == 'sym:':
-            s = c[4:].strip()
+    image.write_image(outputfile, asm.code, symbols=asm.sym)
 
-            if s in sym:
-                c = p8(sym[s])
 
-            else:
-                print(f"unknown symbol: {s}", file=sys.stderr)
-                sys.exit(2)
+def assemble(source, optimize=False):
+    """
+    Assemble source code in memory. `source` is a string or a stream of lines.
+    Returns an image.Image holding the program bytes and the symbol table.
+    Raises AsmError on bad input.
+    """
 
-        outputfile.write(f"{c}\n")
+    if isinstance(source, str):
+        source = io.StringIO(source)
+
+    asm = Assembler(optimize=optimize)
+    asm.feed_all(source)
+    asm.finish()
+
+    return image.Image(bytes(asm.code), symbols=asm.sym)
 
 
 def main(argv):
     # Parse command line
-    inputfile, outputfile = parse_commandline(argv)
+    inputfile, outputfile, optimize = parse_commandline(argv)
 
     # Open files
     inputfile, outputfile = open_files(inputfile, outputfile)
 
-    # Set up the symbol table
-    sym = {}
+    binary = "b" in getattr(outputfile, "mode", "")
+
+    # Assemble, streaming text output as it becomes final
+    asm = Assembler(None if binary else outputfile, optimize)
+
+    try:
+        asm.feed_all(inputfile)
+        asm.finish()
+    except AsmError as e:
+        print(e, file=sys.stderr)
+        return e.status
+
+    if asm.report is not None:
+        import peephole
+        print(peephole.format_report(asm.report), file=sys.stderr)
 
-    # Set up the machine code output
-    code = []
+    if binary:
+        write_binary(outputfile, asm)
 
-    # Assemble
-    pass1(inputfile, sym, code)
-    pass2(outputfile, sym, code)
+    outputfile.flush()
 
     return 0
 
@@ -0,0 +1,80 @@
+; multicore.ls8
+;
+; A shared counter under a spinlock, for ls8/multicore.py
+;
+; Every core adds 50 to Counter, one locked increment at a time, then
+; counts itself in Done. Core 0 waits until Done reaches Cores and prints
+; Counter. Set Cores to the number of cores it runs on.
+;
+; Expected output with 4 cores: 200
+
+    LDI R3,50            ; Increments left for this core
+Next:
+    LDI R1,Acquire
+    CALL R1
+    LDI R1,Counter
+    LD R2,R1
+    INC R2
+    ST R1,R2             ; Counter += 1 while holding the lock
+    LDI R1,Release
+    CALL R1
+    DEC R3
+    LDI R2,0
+    CMP R3,R2
+    LDI R1,Next
+    JNE R1
+
+    LDI R1,Acquire
+    CALL R1
+    LDI R1,Done
+    LD R2,R1
+    INC R2
+    ST R1,R2             ; Done += 1
+    LDI R1,Release
+    CALL R1
+
+    CID R4               ; Only core 0 reports
+    LDI R2,0
+    CMP R4,R2
+    LDI R1,Wait
+    JEQ R1
+    HLT
+
+Wait:
+    LDI R1,Done
+    LD R2,R1
+    LDI R1,Cores
+    LD R4,R1
+    CMP R2,R4
+    LDI R1,Wait
+    JNE R1               ; Spin until every core is done
+    LDI R1,Counter
+    LD R2,R1
+    PRN R2
+    HLT
+
+; Spin until the lock is ours (uses R0-R2)
+Acquire:
+    LDI R0,Lock
+    LDI R1,0
+    TAS R2,R0            ; R2 = the lock byte before; 0 means we took it
+    CMP R2,R1
+    LDI R1,Acquire
+    JNE R1
+    RET
+
+; Let the next core in (uses R0-R1)
+Release:
+    LDI R0,Lock
+    LDI R1,0
+    ST R0,R1
+    RET
+
+Lock:
+    db 0
+Counter:
+    db 0
+Done:
+    db 0
+Cores:
+    db 4
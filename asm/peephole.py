@@ -0,0 +1,281 @@
+"""
+Peephole optimizer for LS-8 assembler source.
+
+Works on the instruction list the assembler builds in optimizing mode:
+
+    ("label", line_num, name)
+    ("op", line_num, opcode, op_a, op_b)
+    ("ds", line_num, line)
+    ("db", line_num, line)
+
+Labels stay symbolic, so the assembler simply re-resolves every address when
+the optimized list is emitted. Rewrites:
+
+* redundant-ldi  LDI of a value the register is already known to hold
+* dead-ldi       LDI whose value is overwritten before anything reads it
+* push-pop       PUSH Rx directly followed by POP Rx
+* jump-next      JMP/JEQ/JNE to the instruction right after the jump
+* jump-thread    LDI Rx,L / JMP Rx where L is LDI Rx,M / JMP Rx (becomes LDI Rx,M),
+                 or where L is a RET or HLT (the jump becomes that instruction)
+
+Known register values are forgotten at every label, CALL and INT, so code
+reached from elsewhere is never rewritten on the strength of one path.
+R5-R7 (IM, IS, SP) are never treated as dead, and their values are never
+assumed (interrupts set IS bits behind the program's back).
+"""
+
+import re
+
+# DS data, as in asm.py
+DS_RE = re.compile(r"(?:(\w+?):)?\s*DS\s*(.+)", re.IGNORECASE)
+
+# ALU ops that read A and B and write A
+ALU2 = {"ADD", "AND", "DIV", "MOD", "MUL", "OR", "SHL", "SHR", "SUB", "XOR"}
+
+# ALU ops that read and write A
+ALU1 = {"INC", "DEC", "NOT"}
+
+# Instructions that set the PC (or stop the CPU)
+CONTROL = {"CALL", "INT", "IRET", "JEQ", "JGE", "JGT", "JLE", "JLT", "JMP", "JNE", "RET", "HLT"}
+
+# Jumps whose target is the register in operand A
+JUMPS = {"JEQ", "JGE", "JGT", "JLE", "JLT", "JMP", "JNE"}
+
+# Registers the optimizer never removes writes to
+RESERVED = {"R5", "R6", "R7"}
+
+
+def reads(item):
+    """Register names an instruction reads"""
+
+    _, _, opcode, op_a, op_b = item
+
+    if opcode in ALU2 or opcode in ("CMP", "ST", "IPI"):
+        return {op_a, op_b}
+    if opcode in ("LD", "TAS"):
+        return {op_b}
+    if opcode in ALU1 or opcode in ("PUSH", "PRN", "PRA", "CALL", "INT") or opcode in JUMPS:
+        return {op_a}
+
+    return set()
+
+
+def writes(item):
+    """Register names an instruction overwrites"""
+
+    _, _, opcode, op_a, op_b = item
+
+    if opcode in ALU2 or opcode in ALU1 or opcode in ("LDI", "LD", "CID", "TAS"):
+        return {op_a}
+    if opcode == "POP":
+        return {op_a, "R7"}
+    if opcode == "PUSH":
+        return {"R7"}
+
+    return set()
+
+
+def size(item, opcodes):
+    """Bytes an item assembles to (labels take none)"""
+
+    kind = item[0]
+
+    if kind == "op":
+        op_type = opcodes.get(item[2], {"type": 0})["type"]
+        return 3 if op_type == 8 else op_type + 1
+    if kind == "db":
+        return 1
+    if kind == "ds":
+        # Everything after the DS keyword is data
+        return len(DS_RE.match(item[2]).group(2))
+
+    return 0
+
+
+def next_op(items, i):
+    """Index of the first instruction at or after i (skipping labels), or None"""
+
+    while i < len(items):
+        if items[i][0] == "op":
+            return i
+        if items[i][0] != "label":
+            return None
+        i += 1
+
+    return None
+
+
+def labels_at(items):
+    """Label name -> index of the item it is attached to"""
+
+    return {item[2]: i for i, item in enumerate(items) if item[0] == "label"}
+
+
+def pass_once(items, stats):
+    """One sweep over the list; returns the new list and whether anything changed"""
+
+    where = labels_at(items)
+    out = []
+    # Register -> value (number string or label name) known to be in it
+    known = {}
+    changed = False
+    i = 0
+
+    def hit(rule):
+        stats[rule] = stats.get(rule, 0) + 1
+
+    while i < len(items):
+        item = items[i]
+        kind = item[0]
+
+        if kind == "label":
+            known = {}
+            out.append(item)
+            i += 1
+            continue
+
+        if kind != "op":
+            out.append(item)
+            i += 1
+            continue
+
+        _, line_num, opcode, op_a, op_b = item
+        following = items[i + 1] if i + 1 < len(items) else None
+
+        # LDI of a value the register already holds
+        if opcode == "LDI" and known.get(op_a) == op_b:
+            hit("redundant-ldi")
+            changed = True
+            i += 1
+            continue
+
+        # LDI that is overwritten before being read
+        if opcode == "LDI" and op_a not in RESERVED:
+            j = i + 1
+            dead = False
+
+            while j < len(items) and items[j][0] in ("op", "label"):
+                if items[j][0] == "op":
+                    if op_a in reads(items[j]) or items[j][2] in CONTROL:
+                        break
+                    if op_a in writes(items[j]):
+                        dead = True
+                        break
+                j += 1
+
+            if dead:
+                hit("dead-ldi")
+                changed = True
+                i += 1
+                continue
+
+        # PUSH Rx / POP Rx
+        if (opcode == "PUSH" and following is not None and following[0] == "op"
+                and following[2] == "POP" and following[3] == op_a):
+            hit("push-pop")
+            changed = True
+            i += 2
+            continue
+
+        if opcode in ("JMP", "JEQ", "JNE") and op_a in known and known[op_a] in where:
+            target = known[op_a]
+
+            # Jump to the instruction that follows anyway (only labels in between)
+            j = i + 1
+            while j < len(items) and items[j][0] == "label":
+                if items[j][2] == target:
+                    break
+                j += 1
+
+            if j < len(items) and items[j][0] == "label" and items[j][2] == target:
+                hit("jump-next")
+                changed = True
+                i += 1
+                continue
+
+            if opcode == "JMP":
+                t = next_op(items, where[target])
+
+                if t is not None:
+                    first = items[t]
+
+                    # Jump straight to a RET or HLT: do it here instead
+                    if first[2] in ("RET", "HLT"):
+                        hit("jump-thread")
+                        changed = True
+                        out.append(("op", line_num, first[2], None, None))
+                        known = {}
+                        i += 1
+                        continue
+
+                    # Jump to another LDI Rx,M / JMP Rx: load M directly
+                    u = t + 1 if t + 1 < len(items) else None
+                    if (first[2] == "LDI" and first[3] == op_a and u is not None
+                            and items[u][0] == "op" and items[u][2] == "JMP" and items[u][3] == op_a
+                            and first[4] != target and out and out[-1][0] == "op"
+                            and out[-1][2] == "LDI" and out[-1][3] == op_a):
+                        hit("jump-thread")
+                        changed = True
+                        prev = out.pop()
+                        out.append(("op", prev[1], "LDI", op_a, first[4]))
+                        out.append(item)
+                        known = {}
+                        i += 1
+                        continue
+
+        # Keep the instruction and update what we know about the registers
+        out.append(item)
+
+        if opcode in ("CALL", "INT", "IRET", "RET"):
+            known = {}
+        elif opcode == "LDI":
+            # IM, IS and SP change under the program (interrupts set IS bits): never assume their values
+            if op_a not in RESERVED:
+                known[op_a] = op_b
+        else:
+            for reg in writes(item):
+                known.pop(reg, None)
+
+        i += 1
+
+    return out, changed
+
+
+def optimize(items, opcodes):
+    """
+    Apply the rewrites until nothing changes. Returns the new list and a
+    report: instructions removed per rule, plus total bytes and instructions
+    before and after.
+    """
+
+    before_bytes = sum(size(item, opcodes) for item in items)
+    before_ops = sum(1 for item in items if item[0] == "op")
+    stats = {}
+    changed = True
+
+    while changed:
+        items, changed = pass_once(items, stats)
+
+    after_bytes = sum(size(item, opcodes) for item in items)
+    after_ops = sum(1 for item in items if item[0] == "op")
+
+    report = {
+        "rules": stats,
+        "bytes_before": before_bytes,
+        "bytes_after": after_bytes,
+        "instructions_before": before_ops,
+        "instructions_after": after_ops,
+    }
+
+    return items, report
+
+
+def format_report(report):
+    """One-paragraph summary for stderr"""
+
+    saved_ops = report["instructions_before"] - report["instructions_after"]
+    saved_bytes = report["bytes_before"] - report["bytes_after"]
+    rules = ", ".join(f"{rule} x{n}" for rule, n in sorted(report["rules"].items())) or "nothing to do"
+
+    return (f"peephole: {saved_ops} instructions ({saved_bytes} bytes) removed, "
+            f"{report['bytes_before']} -> {report['bytes_after']} bytes; {rules}")
@@ -0,0 +1,7 @@
+"""
+Benchmarks for the LS-8 emulator and assembler.
+
+Run from the repository root:
+
+    python -m bench [--save results.json] [--baseline old.json]
+"""
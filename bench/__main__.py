@@ -0,0 +1,116 @@
+"""
+Command line entry point: python -m bench [options]
+
+Runs every example program and the synthetic workloads under each execution
+mode, times the assembler on a large generated source, prints a table and
+optionally saves the results as JSON and compares them with a saved baseline.
+"""
+
+import os
+import sys
+import json
+import argparse
+
+from . import runner
+from .workloads import WORKLOADS, large_source
+
+# Programs that never halt on their own (they wait for interrupts) are cut off here
+DEFAULT_MAX_CYCLES = 200000
+
+# Metrics compared against a baseline, and whether bigger is better
+COMPARED = {
+    "ips": True,
+    "wall_time": False,
+    "peak_memory": False,
+    "assemble_time": False,
+    "text_time": False,
+}
+
+
+def collect(modes, max_cycles, repeat, asm_lines):
+    """Run all benchmarks and return the results dict."""
+
+    results = {"emulator": {}, "assembler": {}}
+
+    # Examples may spin forever, so they get the cycle cap; the synthetic workloads always halt
+    programs = [(name, os.path.join(runner.EXAMPLES, name), max_cycles)
+                for name in sorted(os.listdir(runner.EXAMPLES)) if name.endswith(".ls8")]
+    programs += [(name, runner.asm.assemble(make()), None)
+                 for name, make in WORKLOADS.items()]
+
+    for mode in modes:
+        for name, program, cap in programs:
+            key = f"{mode}/{name}"
+            results["emulator"][key] = runner.bench_program(mode, program, cap, repeat)
+
+    key = f"large_{asm_lines}"
+    results["assembler"][key] = runner.bench_assembler(large_source(asm_lines), repeat)
+
+    return results
+
+
+def print_table(results):
+    print(f"{'benchmark':32} {'cycles':>9} {'wall (s)':>10} {'instr/s':>12} {'peak (KiB)':>11}")
+
+    for key, r in results["emulator"].items():
+        note = f"  [{r['error']}]" if r["error"] else ""
+        print(f"{key:32} {r['cycles']:9d} {r['wall_time']:10.4f} {r['ips']:12.0f} "
+              f"{r['peak_memory'] / 1024:11.1f}{note}")
+
+    for key, r in results["assembler"].items():
+        print(f"asm/{key:28} {r['lines']:9d} lines  bytes {r['assemble_time']:.3f}s  "
+              f"text {r['text_time']:.3f}s  {r['lines_per_second']:.0f} lines/s")
+
+
+def compare(results, baseline):
+    """Print the change of every compared metric relative to the baseline."""
+
+    print()
+    print(f"{'benchmark':32} {'metric':12} {'baseline':>12} {'current':>12} {'change':>8}")
+
+    for section in ("emulator", "assembler"):
+        for key, r in results[section].items():
+            old = baseline.get(section, {}).get(key)
+
+            if old is None:
+                continue
+
+            for metric, higher_is_better in COMPARED.items():
+                if metric not in r or not old.get(metric):
+                    continue
+
+                change = (r[metric] - old[metric]) / old[metric] * 100
+                better = (change > 0) == higher_is_better
+                mark = "+" if better else "-"
+                print(f"{key:32} {metric:12} {old[metric]:12.4g} {r[metric]:12.4g} "
+                      f"{change:7.1f}% {mark}")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Benchmark the LS-8 emulator and assembler")
+    parser.add_argument("--mode", action="append", choices=runner.MODES,
+                        help="execution mode to benchmark (repeatable, default: all)")
+    parser.add_argument("--max-cycles", type=int, default=DEFAULT_MAX_CYCLES)
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per benchmark (best is kept)")
+    parser.add_argument("--asm-lines", type=int, default=100000, help="size of the generated assembler source")
+    parser.add_argument("--save", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against results saved with --save")
+    args = parser.parse_args(argv[1:])
+
+    results = collect(args.mode or list(runner.MODES), args.max_cycles, args.repeat, args.asm_lines)
+    print_table(results)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
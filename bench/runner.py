@@ -0,0 +1,119 @@
+"""
+Measurement helpers: run LS-8 programs and the assembler and collect timings.
+"""
+
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+# The emulator and assembler are plain script directories, not packages
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "ls8"))
+sys.path.insert(0, os.path.join(ROOT, "asm"))
+
+from engines import MODES  # noqa: E402
+from console import Console, CaptureSink  # noqa: E402
+from cpu import FAULTED  # noqa: E402
+import asm  # noqa: E402
+
+EXAMPLES = os.path.join(ROOT, "ls8", "examples")
+
+
+def run_once(mode, program, max_cycles):
+    """
+    Load and run a program (a file path or an in-memory image) once with its
+    output discarded. Returns (cycles, seconds, error).
+    """
+
+    cpu = MODES[mode]()
+    cpu.console = Console(CaptureSink())
+
+    if isinstance(program, str):
+        cpu.load(program)
+    else:
+        cpu.load_program(program)
+
+    error = None
+    start = time.perf_counter()
+
+    try:
+        if cpu.run(max_cycles) == FAULTED:
+            error = f"Fault: {cpu.fault}"
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+
+    seconds = time.perf_counter() - start
+
+    return cpu.cycles, seconds, error
+
+
+def peak_memory(mode, program, max_cycles):
+    """Peak traced allocation (bytes) while loading and running a program."""
+
+    tracemalloc.start()
+
+    try:
+        run_once(mode, program, max_cycles)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_program(mode, program, max_cycles, repeat=3):
+    """
+    Best-of-`repeat` timing for one program under one execution mode, plus a
+    separate (slower, traced) run for peak memory.
+    """
+
+    best = None
+
+    for _ in range(repeat):
+        cycles, seconds, error = run_once(mode, program, max_cycles)
+
+        if best is None or seconds < best[1]:
+            best = (cycles, seconds, error)
+
+    cycles, seconds, error = best
+
+    return {
+        "cycles": cycles,
+        "wall_time": seconds,
+        "ips": cycles / seconds if seconds > 0 else 0.0,
+        "peak_memory": peak_memory(mode, program, max_cycles),
+        "error": error,
+    }
+
+
+def bench_assembler(source, repeat=3):
+    """
+    Best-of-`repeat` timings of the assembler on one source text: straight to
+    bytes, and with the .ls8 text output streamed to an in-memory file.
+    """
+
+    lines = source.count("\n")
+    best_bytes = best_text = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        assembler = asm.Assembler()
+        assembler.feed_all(io.StringIO(source))
+        assembler.finish()
+        t_bytes = time.perf_counter() - start
+
+        start = time.perf_counter()
+        assembler = asm.Assembler(io.StringIO())
+        assembler.feed_all(io.StringIO(source))
+        assembler.finish()
+        t_text = time.perf_counter() - start
+
+        best_bytes = t_bytes if best_bytes is None else min(best_bytes, t_bytes)
+        best_text = t_text if best_text is None else min(best_text, t_text)
+
+    return {
+        "lines": lines,
+        "assemble_time": best_bytes,
+        "text_time": best_text,
+        "lines_per_second": lines / best_text,
+    }
@@ -0,0 +1,137 @@
+"""
+Synthetic LS-8 workloads, as assembler source.
+
+Each generator returns .asm text for a long-running program that ends in HLT.
+Loop counters count down by adding 255 (-1 in 8 bits) until they reach zero.
+"""
+
+import random
+
+
+def recursion(depth=50, repeats=200):
+    """Recurse `depth` levels with CALL/RET (pushing a register per level), `repeats` times."""
+
+    return f"""
+    LDI R1,0
+    LDI R2,255
+    LDI R4,{repeats}
+Top:
+    LDI R0,{depth}
+    LDI R3,Rec
+    CALL R3
+    ADD R4,R2
+    CMP R4,R1
+    LDI R3,Top
+    JNE R3
+    HLT
+Rec:
+    CMP R0,R1
+    LDI R3,Done
+    JEQ R3
+    PUSH R0
+    ADD R0,R2
+    LDI R3,Rec
+    CALL R3
+    POP R0
+Done:
+    RET
+"""
+
+
+def mul_loop(outer=200, inner=250):
+    """`outer` x `inner` iterations of a loop body full of MULs."""
+
+    # Only R0-R4 are used: R5 and R6 are IM and IS
+    return f"""
+    LDI R1,0
+    LDI R4,{outer}
+Outer:
+    LDI R2,{inner}
+Inner:
+    LDI R0,3
+    LDI R3,7
+    MUL R0,R3
+    MUL R0,R3
+    MUL R0,R3
+    MUL R0,R3
+    DEC R2
+    CMP R2,R1
+    LDI R3,Inner
+    JNE R3
+    DEC R4
+    CMP R4,R1
+    LDI R3,Outer
+    JNE R3
+    PRN R0
+    HLT
+"""
+
+
+def stack_churn(outer=200, inner=250):
+    """`outer` x `inner` iterations of PUSH/POP runs."""
+
+    return f"""
+    LDI R1,0
+    LDI R4,{outer}
+Outer:
+    LDI R2,{inner}
+Inner:
+    PUSH R4
+    PUSH R2
+    PUSH R0
+    PUSH R1
+    POP R1
+    POP R0
+    POP R2
+    POP R4
+    DEC R2
+    CMP R2,R1
+    LDI R3,Inner
+    JNE R3
+    DEC R4
+    CMP R4,R1
+    LDI R3,Outer
+    JNE R3
+    HLT
+"""
+
+
+# Name -> generator for the emulator workloads
+WORKLOADS = {
+    "recursion": recursion,
+    "mul_loop": mul_loop,
+    "stack_churn": stack_churn,
+}
+
+
+def large_source(lines=100000, seed=0):
+    """
+    A big, assemblable-only .asm file (it is far larger than 256 bytes, so it
+    is never run) mixing labels, forward/backward references and data.
+    """
+
+    rng = random.Random(seed)
+    ops2 = ["ADD", "MUL", "CMP", "ST"]
+    ops1 = ["PUSH", "POP", "PRN", "JMP", "JEQ", "JNE", "CALL"]
+    out = []
+
+    for i in range(lines):
+        kind = rng.random()
+
+        if i % 50 == 0:
+            out.append(f"L{i}:")
+        elif kind < 0.3:
+            out.append(f"    LDI R{rng.randrange(8)},{rng.randrange(256)}")
+        elif kind < 0.4:
+            # Reference a label some way ahead or behind
+            target = max(0, (i // 50 + rng.randrange(-3, 4)) * 50)
+            target = min(target, (lines - 1) // 50 * 50)
+            out.append(f"    LDI R{rng.randrange(8)},L{target}")
+        elif kind < 0.7:
+            out.append(f"    {rng.choice(ops2)} R{rng.randrange(8)},R{rng.randrange(8)}  ; comment")
+        elif kind < 0.95:
+            out.append(f"    {rng.choice(ops1)} R{rng.randrange(8)}")
+        else:
+            out.append("    DB 0x2a")
+
+    return "\n".join(out) + "\n"
@@ -0,0 +1,68 @@
+"""
+Table-driven 8-bit ALU.
+
+Every two-operand ALU result is looked up in a 64K table indexed by
+(A << 8) | B, and every one-operand result in a 256-entry table indexed by
+A. CMP's table holds the FL byte (00000LGE) instead of a result. Tables are
+packed in `bytes`, built the first time an operation is used, and shared by
+every CPU (and BatchCPU) in the process through TABLES:
+
+    TABLES.ADD[(a << 8) | b]   ->  (a + b) & 0xFF
+    TABLES.INC[a]              ->  (a + 1) & 0xFF
+
+DIV and MOD tables hold 0 for a zero divisor; the caller checks for it.
+"""
+
+# Two-operand operations: result for 8-bit a and b (masked to 8 bits when built)
+BINARY = {
+    "ADD": lambda a, b: a + b,
+    "SUB": lambda a, b: a - b,
+    "MUL": lambda a, b: a * b,
+    "DIV": lambda a, b: a // b if b else 0,
+    "MOD": lambda a, b: a % b if b else 0,
+    "AND": lambda a, b: a & b,
+    "OR": lambda a, b: a | b,
+    "XOR": lambda a, b: a ^ b,
+    "SHL": lambda a, b: a << b if b < 8 else 0,
+    "SHR": lambda a, b: a >> b,
+    # FL byte: L, G or E
+    "CMP": lambda a, b: 0b001 if a == b else (0b010 if a > b else 0b100),
+}
+
+# One-operand operations
+UNARY = {
+    "INC": lambda a: a + 1,
+    "DEC": lambda a: a - 1,
+    "NOT": lambda a: ~a,
+}
+
+
+def build(name):
+    """Compute the packed table for one operation."""
+
+    if name in BINARY:
+        f = BINARY[name]
+        return bytes(f(a, b) & 0xFF for a in range(256) for b in range(256))
+
+    f = UNARY[name]
+    return bytes(f(a) & 0xFF for a in range(256))
+
+
+class Tables:
+    """
+    Lazily built tables: the first read of an attribute (e.g. TABLES.MUL)
+    builds it and stores it on the instance, so later reads are plain
+    attribute lookups.
+    """
+
+    def __getattr__(self, name):
+        if name not in BINARY and name not in UNARY:
+            raise AttributeError(name)
+
+        table = build(name)
+        setattr(self, name, table)
+        return table
+
+
+# The one set of tables everything shares
+TABLES = Tables()
@@ -0,0 +1,170 @@
+from cpu import *
+
+# *** Basic-block compiler: turns straight-line runs of LS-8 code into Python functions ***
+
+# Most instructions a block will hold before it is cut off (keeps generated functions small)
+MAX_BLOCK = 64
+
+# Generated code objects shared by every BlockCPU, keyed by their source (same code at the same address compiles once)
+_code_cache = {}
+
+
+class BlockCPU(CPU):
+    """
+    CPU that discovers basic blocks (straight-line code ending at an instruction
+    that sets the PC, or HLT), compiles each one into a Python function with
+    compile(), and chains the blocks by PC. Guest writes into a compiled block
+    throw it away so it is rebuilt from the new bytes on its next visit.
+    """
+
+    __slots__ = ("blocks", "block_cover")
+
+    def __init__(self):
+        super().__init__()
+        # Compiled blocks keyed by their starting address
+        self.blocks = {}
+        # For every RAM address, the starting addresses of blocks whose code covers it
+        self.block_cover = [[] for _ in range(256)]
+
+    # Drop predecoded entries and any compiled block containing this address
+    def invalidate(self, address):
+        super().invalidate(address)
+        covering = self.block_cover[address]
+        if covering:
+            for start in covering:
+                self.blocks.pop(start, None)
+            covering.clear()
+
+    # Drop every predecoded entry and compiled block
+    def invalidate_all(self):
+        super().invalidate_all()
+        self.blocks.clear()
+        for covering in self.block_cover:
+            covering.clear()
+
+    # Generate the Python source for the block starting at an address (the function returns its instruction count)
+    def block_source(self, start):
+        ram = self.ram
+        lines = []
+        pc = start
+        end = start
+        count = 0
+        while True:
+            ir = ram[pc]
+            op_a = ram[(pc + 1) & 0xFF]
+            op_b = ram[(pc + 2) & 0xFF]
+            end = max(end, pc + (ir >> 6) + 1)
+            # Address of the following instruction, wrapped like the PC
+            nxt = (pc + (ir >> 6) + 1) & 0xFF
+            count += 1
+            if ir == HLT:
+                lines += [f"cpu.pc = {pc}", "cpu.halted = True", f"return {count}"]
+                break
+            # Unknown opcode or bad register: stop here and let decode() raise Fault exactly like the interpreter would
+            if ir not in self.dispatch or not operands_ok(ir, op_a, op_b):
+                lines += [f"cpu.pc = {pc}", f"cpu.cycles += {count - 1}", f"cpu.decode({pc})"]
+                break
+            # Anything that sets the PC ends the block
+            if ir & 0b00010000:
+                if ir == JMP:
+                    lines += [f"cpu.pc = reg[{op_a}]"]
+                elif ir == JEQ:
+                    lines += [f"cpu.pc = reg[{op_a}] if cpu.fl & {FL_E} else {nxt}"]
+                elif ir == JNE:
+                    lines += [f"cpu.pc = {nxt} if cpu.fl & {FL_E} else reg[{op_a}]"]
+                else:
+                    # CALL/RET (and friends) work from the PC of the instruction itself
+                    lines += [f"cpu.pc = {pc}", f"dispatch[{ir}]({op_a}, {op_b})"]
+                lines += [f"return {count}"]
+                break
+            if ir == LDI:
+                lines += [f"reg[{op_a}] = {op_b}"]
+            elif ir == ADD:
+                lines += [f"reg[{op_a}] = (reg[{op_a}] + reg[{op_b}]) & 0xFF"]
+            elif ir == MUL:
+                lines += [f"reg[{op_a}] = (reg[{op_a}] * reg[{op_b}]) & 0xFF"]
+            elif ir == CMP:
+                lines += [f"a = reg[{op_a}]", f"b = reg[{op_b}]",
+                          f"cpu.fl = {FL_E} if a == b else ({FL_G} if a > b else {FL_L})"]
+            else:
+                if ir == DIV or ir == MOD:
+                    # Dividing by zero raises Halt inside the handler: leave the PC and count where the interpreter would
+                    lines += [f"if not reg[{op_b}]:",
+                              f"    cpu.pc = {pc}",
+                              f"    cpu.cycles += {count}"]
+                # Everything else goes through its normal handler
+                lines += [f"dispatch[{ir}]({op_a}, {op_b})"]
+                # If that handler wrote over this block, leave now and recompile from the next instruction
+                if ir in (PUSH, ST):
+                    lines += [f"if blocks.get({start}) is not this:",
+                              f"    cpu.pc = {nxt}",
+                              f"    return {count}"]
+            # Writing IM may unmask a pending interrupt: end the block so run() looks at the events before the next fetch
+            if op_a == IM and ir in WRITES_A:
+                lines += [f"cpu.pc = {nxt}", "cpu.next_event = 0", f"return {count}"]
+                break
+            # Fall through into the next block when we run off the end of RAM or hit the size cap
+            if nxt < pc or count >= MAX_BLOCK:
+                lines += [f"cpu.pc = {nxt}", f"return {count}"]
+                break
+            pc = nxt
+        body = "\n".join("    " + line for line in lines)
+        source = (f"def block_{start:02x}(cpu, reg, dispatch, blocks):\n"
+                  f"    this = blocks.get({start})\n"
+                  f"{body}\n")
+        return source, end
+
+    # Compile (or fetch from the shared cache) the block starting at an address
+    def compile_block(self, start):
+        source, end = self.block_source(start)
+        code = _code_cache.get(source)
+        if code is None:
+            code = compile(source, f"<ls8 block {start:02x}>", "exec")
+            _code_cache[source] = code
+        namespace = {}
+        exec(code, namespace)
+        function = namespace[f"block_{start:02x}"]
+        # Bind the CPU state up front so running a block is one call
+        reg, dispatch, blocks = self.reg, self.dispatch, self.blocks
+
+        def block():
+            return function(self, reg, dispatch, blocks)
+
+        blocks[start] = block
+        # Remember which addresses this block was built from
+        for address in range(start, end):
+            self.block_cover[address & 0xFF].append(start)
+            self.code_map[address & 0xFF] = 1
+        return block
+
+    # Run until HLT, a fault, or until at least max_cycles more instructions have executed (checked between blocks)
+    def run(self, max_cycles=None):
+        self.fault = None
+        blocks = self.blocks
+        limit = None if max_cycles is None else self.cycles + max_cycles
+        self.run_limit = sys.maxsize if limit is None else limit
+        # Run block after block until one of them reaches HLT; each returns how many instructions it executed
+        try:
+            while not self.halted:
+                if limit is not None and self.cycles >= limit:
+                    break
+                # Same event check as CPU.run, made between blocks (INT and IRET always end a block)
+                if self.cycles >= self.next_event:
+                    self.next_event = self.service(self.cycles)
+                    stop = self.next_event if limit is None else min(self.next_event, limit)
+                    self.cycles = self.skip_idle(self.cycles, stop, limit is None)
+                    # Fast-forwarded right up to the event (or the budget): take it before running another block
+                    if self.cycles >= stop:
+                        continue
+                block = blocks.get(self.pc)
+                if block is None:
+                    block = self.compile_block(self.pc)
+                self.cycles += block()
+        except Halt:
+            # A handler inside the block stopped the machine (the block already stored its PC and count)
+            self.halted = True
+        except Fault as e:
+            self.fault = str(e)
+        finally:
+            self.console.flush()
+        return self.status()
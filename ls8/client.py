@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+"""
+Thin client for the emulator daemon (daemon.py).
+
+Usage: client.py [options] <program.ls8 | program.ls8b | program.asm>
+
+Sends one job over the daemon's Unix socket, writes the program's output to
+stdout and a one-line summary to stderr. Exits 1 if the program faulted and
+2 if the daemon couldn't be reached. This module imports nothing from the
+emulator, so it starts as fast as Python does.
+"""
+
+import os
+import sys
+import json
+import base64
+import socket
+import argparse
+
+
+def default_socket():
+    """$XDG_RUNTIME_DIR/ls8.sock, or a per-user path in /tmp"""
+
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+
+    if runtime:
+        return os.path.join(runtime, "ls8.sock")
+
+    return f"/tmp/ls8-{os.getuid()}.sock"
+
+
+def make_job(program, input="", max_cycles=None, mode=None):
+    """
+    The request for a program file: .ls8b images and .asm source are sent
+    as their contents, text .ls8 files by absolute path.
+    """
+
+    if program.endswith(".asm"):
+        with open(program) as f:
+            job = {"source": f.read()}
+    elif program.endswith(".ls8b"):
+        with open(program, "rb") as f:
+            job = {"image": base64.b64encode(f.read()).decode("ascii")}
+    else:
+        job = {"program": os.path.abspath(program)}
+
+    job["input"] = input
+
+    if max_cycles is not None:
+        job["max_cycles"] = max_cycles
+    if mode is not None:
+        job["mode"] = mode
+
+    return job
+
+
+def submit(job, path=None):
+    """Send one job to the daemon and return its reply"""
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(default_socket() if path is None else path)
+
+        with sock.makefile("rwb") as f:
+            f.write(json.dumps(job).encode() + b"\n")
+            f.flush()
+            line = f.readline()
+
+    if not line:
+        raise ConnectionError("daemon closed the connection without replying")
+
+    return json.loads(line)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Run an LS-8 program on the emulator daemon")
+    parser.add_argument("program", help="path to the .ls8/.ls8b file or .asm source")
+    parser.add_argument("--socket", default=None,
+                        help=f"daemon socket (default: {default_socket()})")
+    parser.add_argument("--input", default="",
+                        help="keys to type into the program, one keyboard interrupt each")
+    parser.add_argument("--max-cycles", type=int, default=None,
+                        help="instruction limit (the daemon's own limit still applies)")
+    parser.add_argument("--mode", default=None,
+                        help="execution engine (default: the daemon's)")
+    parser.add_argument("--json", action="store_true",
+                        help="print the daemon's whole reply as JSON instead")
+    args = parser.parse_args(argv[1:])
+
+    job = make_job(args.program, args.input, args.max_cycles, args.mode)
+
+    try:
+        reply = submit(job, args.socket)
+    except OSError as e:
+        print(f"Cannot reach the ls8 daemon: {e}", file=sys.stderr)
+        return 2
+
+    if args.json:
+        json.dump(reply, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        sys.stdout.write(reply.get("output", ""))
+        sys.stdout.flush()
+
+        if reply.get("error"):
+            print(f"Fault: {reply['error']}", file=sys.stderr)
+        else:
+            print(f"{reply['status']}: {reply['cycles']} cycles in "
+                  f"{reply['wall_time'] * 1000:.2f} ms", file=sys.stderr)
+
+    return 1 if reply.get("status") == "faulted" else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
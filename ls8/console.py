@@ -0,0 +1,108 @@
+"""
+Buffered console output for PRN and PRA.
+
+PRN and PRA append to a Console's bytearray instead of calling print(): PRN
+adds the decimal value and a newline, PRA adds the byte itself. The buffer
+goes to the sink when it reaches the threshold, when run() returns (HLT, the
+cycle budget, or an error), before the CPU sleeps waiting for an interrupt,
+or on an explicit flush().
+
+Sinks are anything with write(bytes):
+
+* StdoutSink   sys.stdout, looked up at every write so redirect_stdout works
+* FileSink     a binary file (raw bytes)
+* CaptureSink  an in-memory bytearray, for tests and batch runs
+* NullSink     drops everything (output that was already shown once)
+"""
+
+import sys
+
+# Buffered bytes that trigger a flush
+THRESHOLD = 8192
+
+
+class StdoutSink:
+    """
+    Writes to whatever sys.stdout currently is. Bytes are decoded as Latin-1
+    so each one is the same character print(chr(value)) would have written,
+    and the output matches the unbuffered emulator byte for byte.
+    """
+
+    def write(self, data):
+        stdout = sys.stdout
+        stdout.write(data.decode("latin-1"))
+        stdout.flush()
+
+
+class FileSink:
+    """Appends the raw bytes to a file (a path, or a file object opened in binary mode)"""
+
+    def __init__(self, file):
+        self.file = open(file, "ab") if isinstance(file, str) else file
+
+    def write(self, data):
+        self.file.write(data)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class CaptureSink:
+    """Keeps everything in memory"""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data += data
+
+    def getvalue(self):
+        """Captured output as text (one character per byte, like StdoutSink)"""
+
+        return self.data.decode("latin-1")
+
+
+class NullSink:
+    """Discards everything"""
+
+    def write(self, data):
+        pass
+
+
+class Console:
+    """
+    The output device: PRN/PRA bytes collect here until flushed to the sink
+    (stdout by default).
+    """
+
+    __slots__ = ("sink", "buffer", "threshold")
+
+    def __init__(self, sink=None, threshold=THRESHOLD):
+        self.sink = StdoutSink() if sink is None else sink
+        self.buffer = bytearray()
+        self.threshold = threshold
+
+    def number(self, value):
+        """PRN: the value in decimal and a newline"""
+
+        buffer = self.buffer
+        buffer += b"%d\n" % value
+        if len(buffer) >= self.threshold:
+            self.flush()
+
+    def char(self, value):
+        """PRA: the byte itself"""
+
+        buffer = self.buffer
+        buffer.append(value)
+        if len(buffer) >= self.threshold:
+            self.flush()
+
+    def flush(self):
+        """Hand everything buffered to the sink"""
+
+        if self.buffer:
+            data = bytes(self.buffer)
+            self.buffer.clear()
+            self.sink.write(data)
@@ -1,139 +1,372 @@
 import sys
+import time
+import image
+from alu import TABLES
+from console import Console
+from interrupts import EventQueue, Timer, IM, IS, VECTORS, KEYBOARD, KEY_ADDRESS
+
+# NumPy is only needed for the BatchCPU lockstep engine
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # *** First, specify the address of each command/operation so they can be accessed by the CPU ***
 
 # Add values in registers 1 + 2 and store sum in register #1
 ADD = 0b10100000
+# Bitwise-AND registers A and B, store the result in register A
+AND = 0b10101000
 # Call subroutine (function) at address stored in register
 CALL = 0b01010000
+# Load this core's number into register (multi-core machines only, see multicore.py)
+CID = 0b01001001
 # Compare the values stored in two registers
 CMP = 0b10100111
+# Decrement register by 1
+DEC = 0b01100110
+# Divide register A by register B (integer division), store the result in register A
+DIV = 0b10100011
 # Halt CPU (exit the emulator)
 HLT = 0b00000001
+# Increment register by 1
+INC = 0b01100101
+# Issue the interrupt number stored in register
+INT = 0b01010010
+# Raise the interrupt number in register B on the core numbered in register A (multi-core only)
+IPI = 0b10000110
+# Return from an interrupt handler
+IRET = 0b00010011
 # If equal flag is set (true), jump to address stored in register
 JEQ = 0b01010101
 # Jump to the address stored in register
 JMP = 0b01010100
 # If not equal (false), jump to address stored in register
 JNE = 0b01010110
+# Load register A with the value at the RAM address stored in register B
+LD = 0b10000011
 # Set value of register to integer
 LDI = 0b10000010 
+# Remainder of register A divided by register B, stored in register A
+MOD = 0b10100100
 # Multiply values in registers 1 + 2 and store sum in register #1
 MUL = 0b10100010
+# Bitwise-NOT register
+NOT = 0b01101001
+# Bitwise-OR registers A and B, store the result in register A
+OR = 0b10101010
 # Pop top stack value into register
 POP = 0b01000110
 # Push register value to the stack
 PUSH = 0b01000101
+# Print the ASCII character stored in register
+PRA = 0b01001000
 # Print number stored in register
 PRN = 0b01000111
 # Return from subroutine
 RET = 0b00010001
+# Shift register A left by the number of bits in register B (zeros come in)
+SHL = 0b10101100
+# Shift register A right by the number of bits in register B (zeros come in)
+SHR = 0b10101101
 # Copy (store) value in register #2 to address stored in address #1
 ST = 0b10000100
+# Subtract register B from register A, store the result in register A
+SUB = 0b10100001
+# Atomically load register A from the RAM address in register B and set that byte to 1 if it was 0 (multi-core only)
+TAS = 0b10000101
+# Bitwise-XOR registers A and B, store the result in register A
+XOR = 0b10101011
+
+# Instruction pairs decode() fuses into a single entry, by (first opcode, second opcode)
+FUSIONS = {
+    (CMP, JEQ): "CMP+JEQ",
+    (CMP, JNE): "CMP+JNE",
+    (LDI, JMP): "LDI+JMP",
+    (LDI, CALL): "LDI+CALL",
+    (LDI, JEQ): "LDI+JEQ",
+    (LDI, JNE): "LDI+JNE",
+    (PUSH, PUSH): "PUSH+PUSH",
+    (PUSH, POP): "PUSH+POP",
+    (POP, POP): "POP+POP",
+    (POP, PUSH): "POP+PUSH",
+}
+
+# Mnemonic for each opcode (for traces and profiles)
+NAMES = {
+    ADD: "ADD", AND: "AND", CALL: "CALL", CMP: "CMP", DEC: "DEC", DIV: "DIV", HLT: "HLT", INC: "INC",
+    INT: "INT", IRET: "IRET", JEQ: "JEQ", JMP: "JMP", JNE: "JNE", LD: "LD", LDI: "LDI", MOD: "MOD",
+    MUL: "MUL", NOT: "NOT", OR: "OR", POP: "POP", PUSH: "PUSH", PRA: "PRA", PRN: "PRN", RET: "RET",
+    SHL: "SHL", SHR: "SHR", ST: "ST", SUB: "SUB", XOR: "XOR", CID: "CID", TAS: "TAS", IPI: "IPI",
+}
+
+# Opcodes whose result comes from a precomputed alu.TABLES table, by table name
+ALU_OPS = {
+    ADD: "ADD", AND: "AND", CMP: "CMP", DEC: "DEC", DIV: "DIV", INC: "INC", MOD: "MOD", MUL: "MUL",
+    NOT: "NOT", OR: "OR", SHL: "SHL", SHR: "SHR", SUB: "SUB", XOR: "XOR",
+}
+
+# The same opcodes by name, for CPU.alu()
+ALU_OPCODES = {name: opcode for opcode, name in ALU_OPS.items()}
+
+# Read the bytes of a text .ls8 program file
+def read_program(program):
+    values = []
+    # When the program opens a file...
+    with open(program) as file:
+        # For each line in the file...
+        for line in file:
+            # Remove any lines that [start] with a comment
+            line = line.split("#")[0].strip()
+            # If the line contains no relevant data (empty string)...
+            if line == '':
+                # Continue to the next line
+                continue
+            # Convert the line to a binary (, 2) number and add it to the program
+            values.append(int(line, 2))
+    return values
+
+# R7 is reserved as the stack pointer (SP), and the stack starts at F4 (empty) and grows down (R5/R6 are IM/IS, see interrupts.py)
+SP = 7
+STACK_START = 0xF4
+
+# Flag bits in the FL register (00000LGE)
+FL_L = 0b100
+FL_G = 0b010
+FL_E = 0b001
+
+# Instructions that write the register in operand A (when that is IM, a pending interrupt may become deliverable)
+WRITES_A = {LD, LDI, POP, CID, TAS} | {opcode for opcode in ALU_OPS if opcode != CMP}
+
+# Most instructions the idle probe steps through looking for a loop back to the same state
+SPIN_PROBE = 16
+
+# Instructions the idle probe never executes: output, interrupts, and the ones that can halt
+SPIN_UNSAFE = {PRN, PRA, INT, IRET, DIV, MOD}
+
+# What run() and step() return: the CPU reached HLT, used up its cycle budget, or hit something it can't execute
+HALTED = "halted"
+CYCLE_LIMIT = "cycle_limit"
+FAULTED = "faulted"
+
+# Raised by a handler to stop the CPU the way HLT does (e.g. DIV or MOD by zero)
+class Halt(Exception):
+    pass
+
+# Raised by decode() for an instruction the CPU can't execute (unknown opcode, register operand above R7)
+class Fault(Exception):
+    pass
+
+# Whether an instruction's register operands name R0-R7 (LDI's B is an immediate)
+def operands_ok(ir, op_a, op_b):
+    operands = ir >> 6
+    if operands >= 1 and op_a > 7:
+        return False
+    return operands < 2 or ir == LDI or op_b <= 7
+
+# Saved machine state: RAM and registers in one bytes object, plus the internal registers
+class Snapshot:
+    __slots__ = ("state", "pc", "fl", "cycles", "halted", "interrupts_enabled")
+
+    def __init__(self, state, pc, fl, cycles, halted, interrupts_enabled=True):
+        self.state = state
+        self.pc = pc
+        self.fl = fl
+        self.cycles = cycles
+        self.halted = halted
+        self.interrupts_enabled = interrupts_enabled
 
 # *** Second, initialize the CPU class with: registers, RAM, instruction register, program counter, stack pointer, and flag ***
 
 class CPU:
+    # Fixed attribute set: no per-instance __dict__
+    __slots__ = ("state", "ram", "reg", "ir", "pc", "fl", "cycles", "halted", "decoded", "dispatch", "dirty", "base",
+                 "fusion", "fusion_counts", "code_map", "events", "next_event", "interrupts_enabled", "timer",
+                 "idle_ram", "idle_cycles", "idle_wait", "console", "fault", "recorder", "memo", "run_limit")
+
     def __init__(self):
-        # Preallocate 8 registers (arrays of binary numbers)
-        self.reg = [0b0] * 8
-        # Need a random access memory property to be used with the read and write function
-        self.ram = [0b0] * 256
+        # All 8-bit machine state lives in one buffer: 256 bytes of RAM followed by the 8 registers
+        self.state = bytearray(256 + 8)
+        # Need a random access memory property to be used with the read and write function (a view into the buffer)
+        self.ram = memoryview(self.state)[:256]
+        # Preallocate 8 registers (a view into the buffer, so values are bytes 0-255)
+        self.reg = memoryview(self.state)[256:]
         # Set up Instruction Register -- command currently being excuted -- and assign None for now
         self.ir = None
         # Initialize the program counter, which contains address to the current instruction
         self.pc = 0
-        # Create a stack pointer, which indicates location of last item put on the stack, and subtract 1 from available registers
-        self.sp = 8 - 1
-        # Adding a flag register to track jump, equal, and not equal commands
-        self.fl = [0b0] * 8
+        # The stack pointer is register R7, which starts at F4 (empty stack)
+        self.reg[SP] = STACK_START
+        # Flag register is a single byte: 00000LGE
+        self.fl = 0
+        # Number of instructions executed so far, and whether HLT has been reached
+        self.cycles = 0
+        self.halted = False
+        # Why the CPU faulted (None while it hasn't)
+        self.fault = None
+        # Predecoded instruction cache: one (handler, op A, op B, length, instructions) entry per RAM address (None = not decoded yet)
+        self.decoded = [None] * 256
+        # 1 for every RAM byte some decoded entry was built from, so writes elsewhere (the stack) skip invalidation
+        self.code_map = bytearray(256)
+        # Whether decode() may fuse common instruction pairs into one entry, and how often each fused pair has run
+        self.fusion = True
+        self.fusion_counts = dict.fromkeys(FUSIONS.values(), 0)
+        # Snapshot the RAM is tracked against, and a bitmask of the 16-byte RAM pages written since it was taken
+        self.base = None
+        self.dirty = 0
+        # Pending external events by cycle, and the cycle count at which run() next stops to look at them (0 = now)
+        self.events = EventQueue()
+        self.next_event = 0
+        # Cleared while an interrupt handler runs (until IRET)
+        self.interrupts_enabled = True
+        # The spec's timer: I0 once per second of wall time
+        self.timer = None
+        self.set_timer(seconds=1.0)
+        # RAM as of the last idle check, instructions skipped by fast-forwarding, and how to wait out a wall-clock tick
+        self.idle_ram = None
+        self.idle_cycles = 0
+        self.idle_wait = time.sleep
+        # PRN/PRA output device (buffered, flushed when run() returns; see console.py)
+        self.console = Console()
+        # Gets every external event (key, raised interrupt) and every delivery while recording (see replay.py)
+        self.recorder = None
+        # Cache of pure subroutine results when memoization is on (see memo.py and memoize())
+        self.memo = None
+        # Cycle count the current run()/step() stops at, for event actions that execute instructions themselves (memo.py)
+        self.run_limit = sys.maxsize
 
 # *** Third, set up a dispatch table containing pointers to functions associated with each instruction name: achieves O(1) ***
 
         # Dispatch Table (contains pointers to the functions associated with each command)
         self.dispatch = {
             ADD: self.add,
+            AND: self.and_,
             CALL: self.call,
             CMP: self.cmp,
+            DEC: self.dec,
+            DIV: self.div,
+            INC: self.inc,
+            INT: self.int_,
+            IRET: self.iret,
             JEQ: self.jeq,
             JNE: self.jne,
             JMP: self.jmp,
+            LD: self.ld,
             LDI: self.ldi,
+            MOD: self.mod,
             MUL: self.mul,
+            NOT: self.not_,
+            OR: self.or_,
             POP: self.pop,
             PUSH: self.push,
+            PRA: self.pra,
             PRN: self.prn,
             RET: self.ret,
-            ST: self.st
+            SHL: self.shl,
+            SHR: self.shr,
+            ST: self.st,
+            SUB: self.sub,
+            XOR: self.xor
         }
 
 # *** Fourth, write the functional logic for each part of our program (start with ALU and the five functions assocaited with it) ***
 
-    # ALU means Arithmetic Logic Unit, performs all computations (eliminated helper function as it became obselete with dispatch table)
+    # ALU means Arithmetic Logic Unit, performs all computations (the handlers below look results up in alu.TABLES, this maps names to them)
     def alu(self, op, reg_a, reg_b):
-        if op == "ADD":
-            self.reg[reg_a] += self.reg[reg_b]
-        elif op == "MUL":
-            self.reg[reg_a] *= self.reg[reg_b]
-        elif op == "CMP":
-        # Has three flags: greater (0), less (1), equal (2)
-            self.fl[0] = 0 
-            self.fl[1] = 0
-            self.fl[2] = 0
-            # If first value is greater than second
-            if self.reg[reg_a] > self.reg[reg_b]:
-                # Set appropriate register (0) to true (1)
-                self.fl[0] = 1
-            # If the first value is less than the second
-            if self.reg[reg_a] < self.reg[reg_b]:
-                # Set appropriate register (1) to true (1)
-                self.fl[1] = 1
-            # Otherwise (the values are equal)
-            else:
-                # Set appropriate register (2) to true (1)
-                self.fl[2] = 1
-        elif op == "JEQ":
-            # If the "equal" flag (2) is set to 1 (true)
-            if self.fl[2] == 1:
-                # Jump to that register
-                self.jmp(reg_a, reg_b)
-            else:
-                # Increment counter (accounting for both registers)
-                self.pc += 2
-        elif op == "JNE":
-            # If the "equal" flag (2) is set to 0 (false)
-            if self.fl[2] == 0:
-                # Jump to that register
-                self.jmp(reg_a, reg_b)
-            else: 
-                # Increment counter (accounting for both registers)
-                self.pc += 2
-        else:
+        # Look up the opcode by name instead of walking a string-compared if/elif chain
+        opcode = ALU_OPCODES.get(op)
+        # Anything else (including jumps) is not an ALU operation
+        if opcode is None:
             raise Exception("Unsupported ALU operation")
+        self.dispatch[opcode](reg_a, reg_b)
 
-    # Need to explicitly define this now due to the use of dispatch table
+    # The two-operand handlers index a shared 64K table with (A << 8) | B, so every result is already wrapped to 8 bits
+    # (PC increment handled by the run loop from the opcode's length)
+
+    # Add register B to register A
     def add(self, op_a, op_b):
-        self.alu("ADD", op_a, op_b)
-        # Increment must account for command and both registers
-        self.pc += 3
+        reg = self.reg
+        reg[op_a] = TABLES.ADD[(reg[op_a] << 8) | reg[op_b]]
+
+    # Subtract register B from register A
+    def sub(self, op_a, op_b):
+        reg = self.reg
+        reg[op_a] = TABLES.SUB[(reg[op_a] << 8) | reg[op_b]]
 
-    # Same as comment above
+    # Multiply register A by register B
     def mul(self, op_a, op_b):
-        self.alu("MUL", op_a, op_b)
-        self.pc += 3
+        reg = self.reg
+        reg[op_a] = TABLES.MUL[(reg[op_a] << 8) | reg[op_b]]
+
+    # Divide register A by register B; dividing by zero prints an error and halts
+    def div(self, op_a, op_b):
+        reg = self.reg
+        if not reg[op_b]:
+            print("Error: division by zero", file=sys.stderr)
+            raise Halt()
+        reg[op_a] = TABLES.DIV[(reg[op_a] << 8) | reg[op_b]]
+
+    # Remainder of register A divided by register B (ditto ^ for zero)
+    def mod(self, op_a, op_b):
+        reg = self.reg
+        if not reg[op_b]:
+            print("Error: division by zero", file=sys.stderr)
+            raise Halt()
+        reg[op_a] = TABLES.MOD[(reg[op_a] << 8) | reg[op_b]]
+
+    # Bitwise AND, OR and XOR of registers A and B into register A
+    def and_(self, op_a, op_b):
+        reg = self.reg
+        reg[op_a] = TABLES.AND[(reg[op_a] << 8) | reg[op_b]]
+
+    def or_(self, op_a, op_b):
+        reg = self.reg
+        reg[op_a] = TABLES.OR[(reg[op_a] << 8) | reg[op_b]]
+
+    def xor(self, op_a, op_b):
+        reg = self.reg
+        reg[op_a] = TABLES.XOR[(reg[op_a] << 8) | reg[op_b]]
+
+    # Shift register A left/right by register B bits
+    def shl(self, op_a, op_b):
+        reg = self.reg
+        reg[op_a] = TABLES.SHL[(reg[op_a] << 8) | reg[op_b]]
+
+    def shr(self, op_a, op_b):
+        reg = self.reg
+        reg[op_a] = TABLES.SHR[(reg[op_a] << 8) | reg[op_b]]
+
+    # One-operand ops use the 256-entry tables
+    def inc(self, op_a, op_b):
+        reg = self.reg
+        reg[op_a] = TABLES.INC[reg[op_a]]
+
+    def dec(self, op_a, op_b):
+        reg = self.reg
+        reg[op_a] = TABLES.DEC[reg[op_a]]
 
-    # Compare the two values (a, b) and increment by three
+    def not_(self, op_a, op_b):
+        reg = self.reg
+        reg[op_a] = TABLES.NOT[reg[op_a]]
+
+    # Compare the two values (a, b) and set exactly one of the L, G, E flags (the CMP table holds the FL byte)
     def cmp(self, op_a, op_b):
-        self.alu("CMP", op_a, op_b)
-        self.pc += 3
+        reg = self.reg
+        self.fl = TABLES.CMP[(reg[op_a] << 8) | reg[op_b]]
 
-    # If equal (true), jump to the address (increment handled in ALU)
+    # If equal (true), jump to the address, otherwise step over the command and its register
     def jeq(self, op_a, op_b):
-        self.alu("JEQ", op_a, op_b)
+        if self.fl & FL_E:
+            self.pc = self.reg[op_a]
+        else:
+            self.pc = (self.pc + 2) & 0xFF
 
     # If not equal (false), jump to the address (ditto ^)
     def jne(self, op_a, op_b):
-        self.alu("JNE", op_a, op_b)
+        if not self.fl & FL_E:
+            self.pc = self.reg[op_a]
+        else:
+            self.pc = (self.pc + 2) & 0xFF
 
     # Set PC to address stored in given register
     def jmp(self, op_a, op_b):
@@ -142,89 +375,480 @@ class CPU:
     # Call a subroutine located at address stored on register
     def call(self, op_a, op_b):
         # Assign return address (2 ahead of commnd)
-        ret_add = self.pc + 2
-        # Decrement the stack pointer of register
-        self.reg[self.sp] -= 1
+        ret_add = (self.pc + 2) & 0xFF
+        # Decrement the stack pointer register
+        self.reg[SP] = (self.reg[SP] - 1) & 0xFF
         # Attach ^ to RAM and set it equal to return address -- RAM holds register and register holds stack pointer
-        self.ram[self.reg[self.sp]] = ret_add
+        self.ram_write(ret_add, self.reg[SP])
         # Assign op A register to the PC
         self.pc = self.reg[op_a] # This = performance of subroutine
 
     # Return from a subroutine
     def ret(self, op_a, op_b):
         # Attach SP to register and register to RAM, then assign to ret_add (reverse of call)
-        ret_add = self.ram[self.reg[self.sp]]
+        ret_add = self.ram[self.reg[SP]]
         # Increment register associated with pointer by 1 (notice the net result of 0 when combined with decrement above)
-        self.reg[self.sp] += 1
+        self.reg[SP] = (self.reg[SP] + 1) & 0xFF
         # Assign return address to the PC
         self.pc = ret_add # This = exiting from the subroutine
 
     # Set register value (A) to integer (B)
     def ldi(self, op_a, op_b):
         self.reg[op_a] = op_b
-        # Increment by 3 to reach the next command
-        self.pc += 3
+
+    # Load register A from the RAM address in register B
+    def ld(self, op_a, op_b):
+        self.reg[op_a] = self.ram[self.reg[op_b]]
 
     # Print value from register
     def prn(self, op_a, op_b):
-        # Print value attached to first operation in register
-        print(self.reg[op_a])
-        # Increment by 2 to reach the next command
-        self.pc += 2
+        # Send the value attached to first operation in register to the console (decimal plus newline)
+        self.console.number(self.reg[op_a])
+
+    # Print the ASCII character in the register
+    def pra(self, op_a, op_b):
+        self.console.char(self.reg[op_a])
 
     # Push value from register, store on stack pointer
     def push(self, op_a, op_b):
         # Decrement the stack pointer
-        self.sp -= 1
-        # Assign value on register (A) to the stack pointer stored in RAM
-        self.ram[self.sp] = self.reg[op_a]
-        # Increment +2 to reach next command
-        self.pc += 2
+        self.reg[SP] = (self.reg[SP] - 1) & 0xFF
+        # Assign value on register (A) to the RAM address the stack pointer holds
+        self.ram_write(self.reg[op_a], self.reg[SP])
 
     # Pop top value from stack, store in register
     def pop(self, op_a, op_b):
+        # Assign the value at the stack pointer's RAM address to register (A) -- reverse of push
+        self.reg[op_a] = self.ram[self.reg[SP]]
         # Increment the stack pointer
-        self.sp += 1
-        # Assign the stack pointer stored in RAM to value on register (A) -- reverse of push
-        self.reg[op_a] = self.ram[self.sp]
-        # Increment +2 to reach next command
-        self.pc += 2
+        self.reg[SP] = (self.reg[SP] + 1) & 0xFF
 
-    # Copy the value on register B to address stored for register A
+    # Copy the value on register B to the RAM address stored in register A
     def st(self, op_a, op_b):
-        self.reg[op_a] = self.reg[op_b]
-        # Increment +2 for next command
-        self.pc += 2
+        self.ram_write(self.reg[op_b], self.reg[op_a])
+
+    # Set the IS bit for the interrupt number in the register, then step over the instruction
+    def int_(self, op_a, op_b):
+        # Raised by the program itself, not from outside: a replay reproduces it without a log entry
+        self.reg[IS] |= 1 << (self.reg[op_a] & 7)
+        self.next_event = 0
+        self.pc = (self.pc + 2) & 0xFF
+
+    # Return from an interrupt handler: pop R6-R0, FL and the PC, then re-enable interrupts
+    def iret(self, op_a, op_b):
+        reg = self.reg
+        ram = self.ram
+        for r in range(6, -1, -1):
+            reg[r] = ram[reg[SP]]
+            reg[SP] = (reg[SP] + 1) & 0xFF
+        self.fl = ram[reg[SP]]
+        reg[SP] = (reg[SP] + 1) & 0xFF
+        self.pc = ram[reg[SP]]
+        reg[SP] = (reg[SP] + 1) & 0xFF
+        self.interrupts_enabled = True
+        # Something may have been raised while the handler ran
+        self.next_event = 0
+
+# *** Interrupts: events are scheduled by cycle count, and run() only stops for them when its count reaches next_event ***
+
+    # Set interrupt n's bit in IS and have run() look at it before the next fetch (an external event: devices, timer)
+    def raise_interrupt(self, n):
+        if self.recorder is not None:
+            self.recorder.raised(self.cycles, n)
+        self.reg[IS] |= 1 << n
+        self.next_event = 0
+
+    # Whether a key press now would reach the program (interrupts on, the last key's I1 already taken)
+    def can_take_key(self):
+        return self.interrupts_enabled and not self.reg[IS] & (1 << KEYBOARD)
+
+    # A key press: the key goes to 0xF4 and I1 is raised
+    def press_key(self, key):
+        if self.recorder is not None:
+            self.recorder.key(self.cycles, key)
+        self.ram_write(key, KEY_ADDRESS)
+        self.raise_interrupt(KEYBOARD)
+
+    # Run action(cpu, cycle) once the CPU has executed this many instructions in total
+    def schedule(self, cycle, action):
+        self.events.push(cycle, action)
+        self.next_event = 0
+
+    # Replace the timer: I0 every `cycles` instructions or every `seconds` of wall time (neither = no timer)
+    def set_timer(self, cycles=None, seconds=None):
+        if self.timer is not None:
+            self.timer.active = False
+        self.timer = None
+        if cycles is not None or seconds is not None:
+            self.timer = Timer(cycles, seconds)
+            self.timer.start(self)
+            self.next_event = 0
+
+    # Fire the events due at this cycle count, deliver an interrupt if one is allowed, and return when to check again
+    def service(self, cycles):
+        # Keep the count current for the actions (run() holds it in a local)
+        self.cycles = cycles
+        for action in self.events.pop_due(cycles):
+            action(self, cycles)
+        reg = self.reg
+        if self.interrupts_enabled and reg[IS]:
+            masked = reg[IM] & reg[IS]
+            # Pending but masked ones wait: writes to IM and IRET bring run() back here
+            if masked:
+                self.deliver((masked & -masked).bit_length() - 1)
+        following = self.events.next_cycle()
+        return sys.maxsize if following is None else following
+
+    # Called by run() after servicing events: if the CPU is spinning in a loop with no effect (back to the same state
+    # every pass, no RAM writes, no output), skip whole passes up to stop (the next event or the budget) and return
+    # the new cycle count. The probe really executes the instructions it looks at, so it always returns a valid count.
+    # With wait set (no cycle budget) it also sleeps until a wall-clock timer tick that is the next event.
+    def skip_idle(self, cycles, stop, wait=False):
+        ram = self.ram
+        start_pc = self.pc
+        memory = bytes(ram)
+        # Only worth a look when nothing was written since the last check, or when sitting on a jump
+        if memory != self.idle_ram and ram[start_pc] not in (JMP, JEQ, JNE):
+            self.idle_ram = memory
+            return cycles
+        self.idle_ram = memory
+        # With no event coming and no budget there is nothing to skip ahead to
+        if stop == sys.maxsize:
+            return cycles
+        start = bytes(self.state)
+        start_fl = self.fl
+        decoded = self.decoded
+        dispatch = self.dispatch
+        steps = 0
+        while steps < SPIN_PROBE and cycles + steps < stop:
+            pc = self.pc
+            ir = ram[pc]
+            # Stop short of anything with an effect outside the registers and RAM (or that needs the events looked at,
+            # like a memoized CALL, which leaves its body to an event)
+            op_a = ram[(pc + 1) & 0xFF]
+            if (ir in SPIN_UNSAFE or ir not in dispatch or (op_a == IM and ir in WRITES_A)
+                    or (ir == CALL and self.memo is not None)
+                    or not operands_ok(ir, op_a, ram[(pc + 2) & 0xFF])):
+                break
+            entry = decoded[pc]
+            if entry is None:
+                entry = self.decode(pc)
+            handler, op_a, op_b, length, count = entry
+            steps += count
+            handler(op_a, op_b)
+            if length:
+                self.pc = (pc + length) & 0xFF
+            if self.pc == start_pc and self.fl == start_fl and self.state == start:
+                # Every further pass of this loop is identical: skip as many whole passes as fit before stop
+                skipped = (stop - cycles - steps) // steps * steps
+                self.idle_cycles += skipped
+                timer = self.timer
+                heap = self.events.heap
+                if (wait and timer is not None and timer.due is not None and heap and heap[0][2] is timer
+                        and heap[0][0] == stop):
+                    # The next thing that can happen is a wall-clock tick: sleep until it instead of spinning
+                    delay = timer.due - time.monotonic()
+                    if delay > 0:
+                        # Anything printed so far should be visible while we wait
+                        self.console.flush()
+                        self.idle_wait(delay)
+                return cycles + steps + skipped
+        return cycles + steps
+
+    # Enter the handler for interrupt n, saving the PC, FL and R0-R6 on the stack
+    def deliver(self, n):
+        if self.recorder is not None:
+            self.recorder.delivered(self.cycles, n)
+        reg = self.reg
+        self.interrupts_enabled = False
+        reg[IS] &= ~(1 << n) & 0xFF
+        for value in [self.pc, self.fl] + [reg[r] for r in range(7)]:
+            reg[SP] = (reg[SP] - 1) & 0xFF
+            self.ram_write(value, reg[SP])
+        self.pc = self.ram[VECTORS + n]
 
     # Fetch the address of instruction stored on RAM
     def ram_read(self, address):
         return self.ram[address]
 
     # Store (write) the value attached to address on RAM
-    def ram_write(self, val, address): 
-        self.ram[address] = val
+    def ram_write(self, val, address):
+        # Wrap to the 256 bytes of RAM so the invalidation below hits the right entries
+        address &= 0xFF
+        self.ram[address] = val & 0xFF
+        # Mark the page dirty so restore() only has to copy back what changed
+        self.dirty |= 1 << (address >> 4)
+        # If this byte was decoded as part of an instruction, drop the entries that could contain it
+        if self.code_map[address]:
+            self.invalidate(address)
+
+    # Forget the predecoded entries that could contain the byte at this address
+    def invalidate(self, address):
+        decoded = self.decoded
+        decoded[address] = None
+        decoded[(address - 1) & 0xFF] = None
+        decoded[(address - 2) & 0xFF] = None
+        # Fused pairs span up to 5 bytes
+        decoded[(address - 3) & 0xFF] = None
+        decoded[(address - 4) & 0xFF] = None
+        # Code changed: cached results of subroutines that ran through here may no longer be what the code computes
+        if self.memo is not None:
+            self.memo.forget(address)
+
+    # Forget every predecoded entry (after RAM was replaced wholesale)
+    def invalidate_all(self):
+        self.decoded[:] = [None] * 256
+        self.code_map[:] = bytes(256)
+        if self.memo is not None:
+            self.memo.clear()
+
+    # Decode the instruction at an address once into a (handler, op A, op B, length, instructions) entry and cache it
+    def decode(self, address):
+        ir = self.ram[address]
+        op_a = self.ram[(address + 1) & 0xFF]
+        op_b = self.ram[(address + 2) & 0xFF]
+        # HLT has no handler -- the run loop stops when it sees None
+        handler = None if ir == HLT else self.dispatch.get(ir)
+        if handler is None and ir != HLT:
+            raise Fault(f"unknown opcode {ir:#010b} at {address:#04x}")
+        if not operands_ok(ir, op_a, op_b):
+            raise Fault(f"{NAMES[ir]} at {address:#04x} names a register above R7")
+        # Instruction layout is AABCDDDD: AA is the operand count, C is set when the instruction sets the PC itself
+        length = 0 if ir & 0b00010000 else (ir >> 6) + 1
+        entry = (handler, op_a, op_b, length, 1)
+        if op_a == IM and ir in WRITES_A:
+            # A new IM can unmask a pending interrupt, so this one steps the PC itself and has run() look at the events
+            entry = (self.im_write(handler, length), op_a, op_b, 0, 1)
+        # Try to run this instruction and the next one as a single fused entry
+        elif self.fusion and handler is not None:
+            entry = self.fuse(address, ir) or entry
+        self.decoded[address] = entry
+        # Remember which bytes this entry depends on (up to 5 for a fused pair)
+        code_map = self.code_map
+        for offset in range(5):
+            code_map[(address + offset) & 0xFF] = 1
+        return entry
+
+    # Wrap the handler of an instruction that writes IM so it advances the PC and ends run()'s fast loop
+    def im_write(self, handler, length):
+        def write_im(op_a, op_b):
+            handler(op_a, op_b)
+            self.pc = (self.pc + length) & 0xFF
+            self.next_event = 0
+
+        return write_im
+
+    # Build a fused entry for the pair starting at an address, or return None if it isn't a known pair
+    def fuse(self, address, first):
+        ram = self.ram
+        reg = self.reg
+        counts = self.fusion_counts
+        a1 = ram[(address + 1) & 0xFF]
+        b1 = ram[(address + 2) & 0xFF]
+        second_at = (address + (first >> 6) + 1) & 0xFF
+        second = ram[second_at]
+        a2 = ram[(second_at + 1) & 0xFF]
+        # Where execution continues after the pair if it doesn't jump
+        after = (second_at + (second >> 6) + 1) & 0xFF
+        name = FUSIONS.get((first, second))
+        # A POP into IM has to stay on its own (see decode), and a bad second instruction faults on its own
+        if name is None or (second == POP and a2 == IM) or a2 > 7:
+            return None
+
+        if first == CMP:
+            # CMP A,B then JEQ/JNE R: set FL and branch in one step
+            jump_if_equal = second == JEQ
+            cmp_table = TABLES.CMP
+
+            def cmp_jump(op_a, op_b):
+                counts[name] += 1
+                fl = self.fl = cmp_table[(reg[op_a] << 8) | reg[op_b]]
+                self.pc = reg[a2] if (fl == FL_E) == jump_if_equal else after
+
+            return (cmp_jump, a1, b1, 0, 2)
+
+        if first == LDI:
+            # LDI R,addr then JMP/CALL R
+            if second == JMP:
+                def ldi_jmp(op_a, op_b):
+                    counts[name] += 1
+                    reg[op_a] = op_b
+                    self.pc = reg[a2]
+
+                return (ldi_jmp, a1, b1, 0, 2)
+
+            if second == JEQ or second == JNE:
+                # The usual compiled loop: load the branch target, then branch on the flags CMP left behind
+                jump_if_equal = second == JEQ
+
+                def ldi_branch(op_a, op_b):
+                    counts[name] += 1
+                    reg[op_a] = op_b
+                    self.pc = reg[a2] if bool(self.fl & FL_E) == jump_if_equal else after
+
+                return (ldi_branch, a1, b1, 0, 2)
+
+            # Through the dispatch table, so a memoizing CALL (see memoize()) is used when installed
+            call = self.dispatch[CALL]
+
+            def ldi_call(op_a, op_b):
+                counts[name] += 1
+                reg[op_a] = op_b
+                # CALL pushes the address after itself, which it works out from the PC
+                self.pc = second_at
+                call(a2, 0)
+
+            return (ldi_call, a1, b1, 0, 2)
+
+        # Two stack operations in a row
+        handler1 = self.dispatch[first]
+        handler2 = self.dispatch[second]
+
+        # A PUSH that just wrote over the second instruction: run what RAM holds there now, as unfused code would
+        def run_second():
+            self.pc = second_at
+            handler, op_a, op_b, length, count = self.decoded[second_at] or self.decode(second_at)
+            if handler is None:
+                raise Halt()
+            if count != 1:
+                ir = ram[second_at]
+                handler = self.dispatch[ir]
+                length = (ir >> 6) + 1
+            handler(op_a, op_b)
+            if length:
+                self.pc = (second_at + length) & 0xFF
+
+        if first == PUSH and second == POP and SP not in (a1, a2):
+            # Net effect: copy the register through the stack slot just below SP
+            write = self.ram_write
+
+            def push_pop(op_a, op_b):
+                counts[name] += 1
+                sp = (reg[SP] - 1) & 0xFF
+                write(reg[op_a], sp)
+                if (sp - second_at) & 0xFF < 2:
+                    reg[SP] = sp
+                    run_second()
+                    return
+                reg[a2] = ram[sp]
+                self.pc = after
+
+            return (push_pop, a1, b1, 0, 2)
+
+        pushes = first == PUSH
+
+        def stack_pair(op_a, op_b):
+            counts[name] += 1
+            handler1(op_a, 0)
+            if pushes and (reg[SP] - second_at) & 0xFF < 2:
+                run_second()
+                return
+            handler2(a2, 0)
+            self.pc = after
+
+        return (stack_pair, a1, b1, 0, 2)
+
+    # How often each fused pair has run, for pairs that ran at all
+    def fusion_report(self):
+        return {name: count for name, count in self.fusion_counts.items() if count}
+
+    # Turn on memoization of pure subroutines (see memo.py): CALL goes through the cache; returns the Memoizer
+    def memoize(self, capacity=None):
+        import memo
+        self.memo = memo.Memoizer(self) if capacity is None else memo.Memoizer(self, capacity)
+        self.dispatch[CALL] = self.memo.call
+        # Entries decoded so far (and fused LDI+CALL pairs) still hold the old CALL
+        self.invalidate_all()
+        return self.memo
     
+    # Capture the whole machine state; RAM writes from here on are tracked against it
+    def snapshot(self):
+        snap = Snapshot(bytes(self.state), self.pc, self.fl, self.cycles, self.halted, self.interrupts_enabled)
+        self.base = snap
+        self.dirty = 0
+        return snap
+
+    # Put the machine back into a snapshot's state
+    def restore(self, snap):
+        saved = snap.state
+        if snap is self.base:
+            # Only the pages written since the snapshot can differ, and only changed bytes need re-decoding
+            ram = self.ram
+            dirty = self.dirty
+            page = 0
+            while dirty:
+                if dirty & 1:
+                    for address in range(page << 4, (page + 1) << 4):
+                        if ram[address] != saved[address]:
+                            ram[address] = saved[address]
+                            self.invalidate(address)
+                dirty >>= 1
+                page += 1
+            self.reg[:] = saved[256:]
+        else:
+            # A different snapshot: one buffer copy and a fresh decode cache
+            self.state[:] = saved
+            self.invalidate_all()
+        self.pc = snap.pc
+        self.fl = snap.fl
+        self.cycles = snap.cycles
+        self.halted = snap.halted
+        self.fault = None
+        self.interrupts_enabled = snap.interrupts_enabled
+        self.base = snap
+        self.dirty = 0
+        # IS/IM may have changed under run()
+        self.next_event = 0
+
+    # A new CPU of the same kind, starting from this one's current state
+    def fork(self):
+        clone = type(self)()
+        # Built directly rather than through snapshot() so this CPU's own dirty tracking is left alone
+        clone.restore(Snapshot(bytes(self.state), self.pc, self.fl, self.cycles, self.halted,
+                               self.interrupts_enabled))
+        return clone
+
     # Load the information contained within a command
-    def load(self):
-        address = 0
-        # Program -- ls8.py -- is first argument after python
-        program = sys.argv[1]
-        # When the program opens a file...
-        with open(program) as file:
-            # For each line in the file...
-            for line in file:
-                # Remove any lines that [start] with a comment
-                line = line.split("#")[0].strip()
-                # If the line contains no relevant data (empty string)...
-                if line == '':
-                    # Continue to the next line
-                    continue
-                # Convert the line to a binary (, 2) number and assign to value
-                value = int(line, 2)
-                # Store (assign) the value to the address contained in RAM
-                self.ram[address] = value
-                # Increment to the next instruction/command address
-                address += 1
+    def load(self, program=None):
+        # Program -- ls8.py -- is first argument after python (unless a file name is passed in)
+        if program is None:
+            program = sys.argv[1]
+        # Prebuilt binary images skip the text parse entirely
+        if image.is_image(program):
+            self.load_image(program)
+            return
+        # Store (assign) each value to its address in RAM (through ram_write so stale decodes are dropped)
+        for address, value in enumerate(read_program(program)):
+            self.ram_write(value, address)
+
+    # Copy raw program bytes into RAM at an address (no files involved)
+    def load_bytes(self, data, address=0):
+        if address + len(data) > 256:
+            raise ValueError(f"program of {len(data)} bytes does not fit in RAM at {address:#04x}")
+        self.ram[address:address + len(data)] = data
+        # Same bookkeeping as load_image: nothing decoded from the old bytes survives
+        self.invalidate_all()
+        self.dirty = (1 << 16) - 1
+
+    # Load an in-memory image.Image (e.g. from asm.assemble) and start at its entry point; returns its symbol table
+    def load_program(self, program):
+        self.load_bytes(program.code, program.load_address)
+        self.pc = program.entry
+        return program.symbols
+
+    # Load a binary .ls8b image: the program bytes are read straight into RAM in one copy; returns its symbol table
+    def load_image(self, program):
+        with open(program, "rb") as file:
+            entry, load_address, length, count = image.read_header(file)
+            if file.readinto(self.ram[load_address:load_address + length]) != length:
+                raise ValueError("truncated LS-8 image")
+            symbols = image.read_symbols(file, count)
+        # RAM changed behind ram_write's back: drop every decode and treat every page as dirty
+        self.invalidate_all()
+        self.dirty = (1 << 16) - 1
+        # Start executing at the image's entry point
+        self.pc = entry
+        return symbols
 
     def trace(self):
         """
@@ -232,13 +856,13 @@ class CPU:
         from run() if you need help debugging.
         """
 
-        print(f"TRACE: %02X | %02X %02X %02X |" % (
+        print(f"TRACE: %02X | %02X | %02X %02X %02X |" % (
             self.pc,
-            #self.fl,
+            self.fl,
             #self.ie,
             self.ram_read(self.pc),
-            self.ram_read(self.pc + 1),
-            self.ram_read(self.pc + 2)
+            self.ram_read((self.pc + 1) & 0xFF),
+            self.ram_read((self.pc + 2) & 0xFF)
         ), end='')
 
         for i in range(8):
@@ -246,20 +870,296 @@ class CPU:
 
         print()
 
-    def run(self):
-        # Initialize with Boolean so we can turn "On" (True) and "Off" (False)
-        running = True
-        # While the program is running...
-        while running:
-            # Assign PC command stored in RAM to Instruction Register (IR)
-            ir = self.ram[self.pc]
-            # Assign first PC address after command (typically value) to operand A
-            op_a = self.ram_read(self.pc + 1)
-            # Assign second PC address after command (typically register) to operand B
-            op_b = self.ram_read(self.pc + 2)
-            # If the PC command is HLT (halt), turn the program off
-            if ir == HLT:
-                running = False
-            # Otherwise, select the instruction register from dispatch table and pass in the operators
-            else:
-                self.dispatch[ir](op_a, op_b)
\ No newline at end of file
+    # Run until HLT, a fault, or until max_cycles more instructions have executed; returns HALTED, FAULTED or CYCLE_LIMIT
+    def run(self, max_cycles=None):
+        # Already stopped at HLT: nothing runs and no cycles are counted (same as BlockCPU)
+        if self.halted:
+            return HALTED
+        self.fault = None
+        # Keep the cache and the cycle count in locals so the loop doesn't look them up on every instruction
+        decoded = self.decoded
+        cycles = self.cycles
+        # With no budget the limit is never reached (a fused entry may overshoot a budget by one instruction)
+        limit = sys.maxsize if max_cycles is None else cycles + max_cycles
+        self.run_limit = limit
+        # Set while the fast loop holds the PC in a local (written back on the way out)
+        pc = None
+        try:
+            # While the program is running...
+            while cycles < limit:
+                # Fire due events and deliver interrupts, then run flat out until the next event (or the budget)
+                stop = min(self.service(cycles), limit)
+                # An event action may have executed instructions itself (a memoized call's body, see memo.py)
+                cycles = self.cycles
+                # Fast-forward through a loop that is only waiting for that event
+                cycles = self.skip_idle(cycles, stop, max_cycles is None)
+                self.next_event = stop
+                # The PC lives in a local too: self.pc is only current around handlers that read or set it
+                pc = self.pc
+                while cycles < stop:
+                    # Fetch the predecoded entry for the current PC, decoding it on first visit
+                    entry = decoded[pc]
+                    if entry is None:
+                        entry = self.decode(pc)
+                    handler, op_a, op_b, length, count = entry
+                    cycles += count
+                    # If the PC command is HLT (halt), turn the program off
+                    if handler is None:
+                        self.halted = True
+                        return HALTED
+                    # Otherwise, run the handler and advance past the command (length is 0 when the handler set the PC)
+                    if length:
+                        handler(op_a, op_b)
+                        pc = (pc + length) & 0xFF
+                    else:
+                        self.pc = pc
+                        # Not ours to write back if the handler raises: it may already have moved self.pc
+                        pc = None
+                        handler(op_a, op_b)
+                        pc = self.pc
+                        if self.next_event < stop:
+                            # INT/IRET (which set the PC themselves) dropped next_event to have the events looked at now
+                            break
+                self.pc = pc
+                pc = None
+        except Halt:
+            # A handler stopped the machine (the faulting instruction still counts)
+            self.halted = True
+        except Fault as e:
+            # Nothing executed: the PC stays on the bad instruction
+            self.fault = str(e)
+        finally:
+            if pc is not None:
+                self.pc = pc
+            self.cycles = cycles
+            self.console.flush()
+        return self.status()
+
+    # Execute exactly n instructions (fewer if the CPU halts or faults first); returns the status like run()
+    def step(self, n=1):
+        if self.halted:
+            return HALTED
+        self.fault = None
+        ram = self.ram
+        target = self.cycles + n
+        self.run_limit = target
+        try:
+            while self.cycles < target:
+                if self.cycles >= self.next_event:
+                    self.next_event = self.service(self.cycles)
+                    # The events may have executed instructions of their own (see memo.py): count them against n
+                    continue
+                pc = self.pc
+                entry = self.decoded[pc]
+                if entry is None:
+                    entry = self.decode(pc)
+                handler, op_a, op_b, length, count = entry
+                if count != 1:
+                    # A fused pair: run only its first instruction (never one that sets the PC)
+                    ir = ram[pc]
+                    handler = self.dispatch[ir]
+                    length = (ir >> 6) + 1
+                self.cycles += 1
+                if handler is None:
+                    self.halted = True
+                    break
+                handler(op_a, op_b)
+                if length:
+                    self.pc = (pc + length) & 0xFF
+        except Halt:
+            self.halted = True
+        except Fault as e:
+            self.fault = str(e)
+        finally:
+            self.console.flush()
+        return self.status()
+
+    # HALTED, FAULTED, or CYCLE_LIMIT for a CPU that can keep running
+    def status(self):
+        if self.halted:
+            return HALTED
+        return CYCLE_LIMIT if self.fault is None else FAULTED
+
+
+# *** Fifth, a lockstep engine that runs the same program on many machines at once with NumPy ***
+
+class BatchCPU:
+    """
+    N LS-8 machines stepped in lockstep. Registers, flags, PC, SP and RAM for
+    all of them live in NumPy arrays (N x 8, N x 256, ...), and each step runs
+    one vectorized handler per opcode currently under a PC, so lanes that have
+    halted, faulted or branched somewhere else are simply masked out.
+    """
+
+    def __init__(self, n):
+        if np is None:
+            raise Exception("BatchCPU requires NumPy")
+        self.n = n
+        # Same 8-bit state as CPU, one row per machine (uint8 arithmetic wraps like the real registers)
+        self.reg = np.zeros((n, 8), dtype=np.uint8)
+        self.ram = np.zeros((n, 256), dtype=np.uint8)
+        self.pc = np.zeros(n, dtype=np.uint8)
+        self.fl = np.zeros(n, dtype=np.uint8)
+        self.reg[:, SP] = STACK_START
+        # Lanes that reached HLT, and lanes that hit an unknown opcode or a register above R7
+        self.halted = np.zeros(n, dtype=bool)
+        self.faulted = np.zeros(n, dtype=bool)
+        # PRN output collected per machine instead of printed
+        self.output = [[] for _ in range(n)]
+
+        # Vectorized handlers, each takes the lane indices plus their A/B operands (ALU ops are added by alu_handler on first use)
+        self.dispatch = {
+            CALL: self.call,
+            HLT: self.hlt,
+            JEQ: self.jeq,
+            JNE: self.jne,
+            JMP: self.jmp,
+            LD: self.ld,
+            LDI: self.ldi,
+            POP: self.pop,
+            PUSH: self.push,
+            PRN: self.prn,
+            RET: self.ret,
+            ST: self.st
+        }
+
+    # Copy the same program into every machine's RAM (a text .ls8 file, a binary image file, an image.Image, or a list of bytes)
+    def load(self, program):
+        if isinstance(program, str) and image.is_image(program):
+            program = image.read_image(program)
+        if isinstance(program, image.Image):
+            img = program
+            self.ram[:, img.load_address:img.load_address + len(img.code)] = np.frombuffer(img.code, dtype=np.uint8)
+            self.pc[:] = img.entry
+            return
+        values = read_program(program) if isinstance(program, str) else list(program)
+        self.ram[:, :len(values)] = values
+
+    # Vectorized handler for a table-driven ALU op, built the first time the opcode shows up (so is its table)
+    def alu_handler(self, opcode):
+        name = ALU_OPS.get(opcode)
+        if name is None:
+            return None
+        # The same bytes CPU uses, viewed as a uint8 array without copying
+        table = np.frombuffer(getattr(TABLES, name), dtype=np.uint8)
+
+        if opcode == CMP:
+            def handler(lanes, op_a, op_b):
+                index = (self.reg[lanes, op_a].astype(np.intp) << 8) | self.reg[lanes, op_b]
+                self.fl[lanes] = table[index]
+                self.pc[lanes] += 3
+
+        elif name in ("INC", "DEC", "NOT"):
+            def handler(lanes, op_a, op_b):
+                self.reg[lanes, op_a] = table[self.reg[lanes, op_a]]
+                self.pc[lanes] += 2
+
+        else:
+            divide = opcode == DIV or opcode == MOD
+
+            def handler(lanes, op_a, op_b):
+                b = self.reg[lanes, op_b]
+                if divide:
+                    # Lanes dividing by zero halt where they are (CPU prints an error and halts too)
+                    zero = b == 0
+                    if zero.any():
+                        self.halted[lanes[zero]] = True
+                        lanes, op_a, b = lanes[~zero], op_a[~zero], b[~zero]
+                index = (self.reg[lanes, op_a].astype(np.intp) << 8) | b
+                self.reg[lanes, op_a] = table[index]
+                self.pc[lanes] += 3
+
+        self.dispatch[opcode] = handler
+        return handler
+
+    def jeq(self, lanes, op_a, op_b):
+        self.pc[lanes] = np.where(self.fl[lanes] & FL_E, self.reg[lanes, op_a], self.pc[lanes] + 2)
+
+    def jne(self, lanes, op_a, op_b):
+        self.pc[lanes] = np.where(self.fl[lanes] & FL_E, self.pc[lanes] + 2, self.reg[lanes, op_a])
+
+    def jmp(self, lanes, op_a, op_b):
+        self.pc[lanes] = self.reg[lanes, op_a]
+
+    def call(self, lanes, op_a, op_b):
+        # Push the return address, then jump
+        self.reg[lanes, SP] -= 1
+        self.ram[lanes, self.reg[lanes, SP]] = self.pc[lanes] + 2
+        self.pc[lanes] = self.reg[lanes, op_a]
+
+    def ret(self, lanes, op_a, op_b):
+        self.pc[lanes] = self.ram[lanes, self.reg[lanes, SP]]
+        self.reg[lanes, SP] += 1
+
+    def ldi(self, lanes, op_a, op_b):
+        self.reg[lanes, op_a] = op_b
+        self.pc[lanes] += 3
+
+    def ld(self, lanes, op_a, op_b):
+        self.reg[lanes, op_a] = self.ram[lanes, self.reg[lanes, op_b]]
+        self.pc[lanes] += 3
+
+    def prn(self, lanes, op_a, op_b):
+        for lane, value in zip(lanes.tolist(), self.reg[lanes, op_a].tolist()):
+            self.output[lane].append(value)
+        self.pc[lanes] += 2
+
+    def push(self, lanes, op_a, op_b):
+        self.reg[lanes, SP] -= 1
+        self.ram[lanes, self.reg[lanes, SP]] = self.reg[lanes, op_a]
+        self.pc[lanes] += 2
+
+    def pop(self, lanes, op_a, op_b):
+        self.reg[lanes, op_a] = self.ram[lanes, self.reg[lanes, SP]]
+        self.reg[lanes, SP] += 1
+        self.pc[lanes] += 2
+
+    def st(self, lanes, op_a, op_b):
+        self.ram[lanes, self.reg[lanes, op_a]] = self.reg[lanes, op_b]
+        self.pc[lanes] += 3
+
+    def hlt(self, lanes, op_a, op_b):
+        self.halted[lanes] = True
+
+    # Run one instruction on every live machine; returns how many were live
+    def step(self):
+        live = np.flatnonzero(~(self.halted | self.faulted))
+        if live.size == 0:
+            return 0
+        pc = self.pc[live]
+        ir = self.ram[live, pc]
+        # Operands are register numbers except LDI's immediate
+        op_a = self.ram[live, (pc + 1).astype(np.uint8)]
+        op_b = self.ram[live, (pc + 2).astype(np.uint8)]
+        # One vectorized handler call per distinct opcode under the live PCs
+        for opcode in np.unique(ir).tolist():
+            group = ir == opcode
+            lanes = live[group]
+            handler = self.dispatch.get(opcode) or self.alu_handler(opcode)
+            if handler is None:
+                self.faulted[lanes] = True
+                continue
+            a = op_a[group]
+            b = op_b[group]
+            # A register operand above R7 faults the lane, like decode() does on CPU
+            operands = opcode >> 6
+            bad = np.zeros(lanes.size, dtype=bool)
+            if operands >= 1:
+                bad |= a > 7
+            if operands >= 2 and opcode != LDI:
+                bad |= b > 7
+            if bad.any():
+                self.faulted[lanes[bad]] = True
+                lanes, a, b = lanes[~bad], a[~bad], b[~bad]
+            if lanes.size:
+                handler(lanes, a, b)
+        return live.size
+
+    # Step until every machine has halted or faulted (or max_steps runs out); returns the steps taken
+    def run(self, max_steps=None):
+        steps = 0
+        while max_steps is None or steps < max_steps:
+            if self.step() == 0:
+                break
+            steps += 1
+        return steps
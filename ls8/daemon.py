@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+"""
+Emulator daemon: a long-lived server that runs LS-8 jobs on warm workers.
+
+Usage: daemon.py [--socket PATH] [--workers N] [--mode MODE] [--max-cycles N]
+
+The daemon listens on a Unix domain socket (see client.default_socket) and
+keeps a pool of worker processes that have already imported the engines and
+the assembler and built the ALU tables. A job only pays for its own
+execution, not for starting Python.
+
+The protocol is one JSON object per line in each direction. A request is a
+farm job with its program given one of three ways:
+
+    {"image": "<base64 .ls8b bytes>", "input": "ab", "max_cycles": 100000}
+    {"source": "<.asm text>", "mode": "blocks"}
+    {"program": "/absolute/path/to/prog.ls8"}
+
+The reply is the job's farm report row (status, cycles, wall_time, output,
+error), or {"status": "faulted", "error": "..."} for a request that could
+not be read. A connection can send any number of requests; they are
+answered in order.
+"""
+
+import os
+import sys
+import json
+import base64
+import signal
+import asyncio
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+import farm
+from alu import BINARY, UNARY, TABLES
+from client import default_socket
+from engines import MODES
+
+# Longest request line accepted (the base64 image or the source text is most of it)
+LINE_LIMIT = 1 << 20
+
+# Instruction limit for jobs that don't set one, so no job can keep a worker forever
+MAX_CYCLES = 50_000_000
+
+
+def warm():
+    """Worker initializer: pay every one-time cost before the first job arrives"""
+
+    for name in list(BINARY) + list(UNARY):
+        getattr(TABLES, name)
+
+    # Imports the assembler and runs every engine once
+    for mode in MODES:
+        farm.run_job({"source": "HLT\n", "mode": mode, "max_cycles": None, "input": ""})
+
+
+def read_request(line, mode, max_cycles):
+    """Turn one request line into a farm job (raises ValueError if it isn't one)"""
+
+    job = json.loads(line)
+
+    if not isinstance(job, dict):
+        raise ValueError("request must be a JSON object")
+    if not any(key in job for key in ("image", "source", "program")):
+        raise ValueError("request needs an image, source or program")
+
+    if job.get("image") is not None:
+        job["image"] = base64.b64decode(job["image"])
+
+    job.setdefault("mode", mode)
+    job.setdefault("input", "")
+
+    if job["mode"] not in MODES:
+        raise ValueError(f"unknown mode {job['mode']!r}")
+
+    # The server's limit caps whatever the job asks for
+    limit = job.get("max_cycles")
+    job["max_cycles"] = max_cycles if limit is None or max_cycles is None else min(limit, max_cycles)
+
+    return job
+
+
+class Daemon:
+    """Accepts connections and hands their jobs to the worker pool"""
+
+    def __init__(self, path, workers=None, mode="interp", max_cycles=MAX_CYCLES):
+        self.path = path
+        self.workers = workers or os.cpu_count() or 1
+        self.mode = mode
+        self.max_cycles = max_cycles
+        self.pool = None
+
+    async def handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+
+        try:
+            while (line := await reader.readline()):
+                try:
+                    job = read_request(line, self.mode, self.max_cycles)
+                except (ValueError, TypeError) as e:
+                    row = {"status": "faulted", "error": f"bad request: {e}"}
+                else:
+                    try:
+                        row = await loop.run_in_executor(self.pool, farm.run_job, job)
+                        # The client already knows what it sent
+                        del row["input"]
+                    except (Exception, SystemExit) as e:
+                        # Whatever went wrong in the worker is this job's failure, never the server's
+                        row = {"status": "faulted", "error": f"{type(e).__name__}: {e}"}
+
+                writer.write(json.dumps(row).encode() + b"\n")
+                await writer.drain()
+
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            # Client went away, or sent a line longer than LINE_LIMIT
+            pass
+
+        finally:
+            writer.close()
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=warm) as self.pool:
+            # Start (and so warm) every worker now rather than on the first jobs
+            await asyncio.gather(*(loop.run_in_executor(self.pool, os.getpid)
+                                   for _ in range(self.workers)))
+
+            # A socket file left by a daemon that didn't exit cleanly would make bind() fail
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.path)
+
+            server = await asyncio.start_unix_server(self.handle, self.path, limit=LINE_LIMIT)
+            os.chmod(self.path, 0o600)
+            print(f"ls8 daemon: {self.workers} workers on {self.path}", file=sys.stderr)
+
+            try:
+                async with server:
+                    await stop.wait()
+            finally:
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(self.path)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Serve LS-8 jobs from a pool of warm workers")
+    parser.add_argument("--socket", default=default_socket(),
+                        help="Unix socket path (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes (default: one per core)")
+    parser.add_argument("--mode", choices=MODES, default="interp",
+                        help="execution engine for jobs that don't name one")
+    parser.add_argument("--max-cycles", type=int, default=MAX_CYCLES,
+                        help="instruction limit per job (default: %(default)s; 0 = none)")
+    args = parser.parse_args(argv[1:])
+
+    daemon = Daemon(args.socket, args.workers, args.mode, args.max_cycles or None)
+    asyncio.run(daemon.serve())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+
+"""
+Time-travel debugger: step, continue and run backwards through a program.
+
+Usage: debugger.py [--interval K] [--checkpoints N] <program.ls8 | .ls8b | .asm>
+
+While the program runs forward, TimeTravel keeps:
+
+* a checkpoint (a Snapshot, 264 bytes of state) every `interval` cycles
+* a log of the RAM writes since that checkpoint: cycle, address, old and
+  new value, 8 bytes each, in an array
+* the external events since that checkpoint (keys and raised interrupts;
+  the debugger is the CPU's recorder, as in replay.py)
+
+Going back to cycle T restores the last checkpoint at or before T and
+re-executes up to T with the logged events injected at their original
+cycles. Nothing outside the machine is touched: the timer is off the queue
+and output is discarded until execution reaches the furthest cycle already
+run (the frontier), where it goes live again. Every backward move replays
+at most `interval` instructions per checkpoint it looks at.
+
+Only the last `checkpoints` checkpoints (and their logs) are kept, so the
+memory used is bounded and history reaches back interval * checkpoints
+cycles.
+
+    tt = TimeTravel(cpu, interval=10000, checkpoints=1000)
+    tt.breakpoints.add(0x1D)
+    tt.run()                  # forward to the breakpoint
+    tt.step_back(5)
+    tt.back_to_write(0xF0)    # PC on the instruction that last wrote 0xF0
+    tt.reverse_continue()     # previous time the PC was on a breakpoint
+"""
+
+import os
+import sys
+import cmd
+import argparse
+from array import array
+from collections import deque
+
+from cpu import *
+from console import Console, NullSink
+from interrupts import EventQueue, KEY_ADDRESS
+from replay import KEY, RAISE
+
+# Cycles between checkpoints, and checkpoints kept (history of 10M cycles, ~100 KB of them)
+INTERVAL = 10000
+CHECKPOINTS = 1000
+
+# run()/step() status when a breakpoint stopped execution
+BREAKPOINT = "breakpoint"
+
+
+class Segment:
+    """A checkpoint and everything logged between it and the next one"""
+
+    __slots__ = ("snapshot", "writes", "events")
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        # (cycle << 24) | (address << 16) | (old << 8) | new for every RAM byte written
+        self.writes = array("Q")
+        # (cycle, kind, value) external events, as in replay.EventLog
+        self.events = []
+
+
+class TimeTravel:
+    """
+    Drives a CPU one instruction at a time, checkpointing as it goes, so it
+    can be moved back to any cycle still covered by a checkpoint.
+    """
+
+    def __init__(self, cpu, interval=INTERVAL, checkpoints=CHECKPOINTS):
+        self.cpu = cpu
+        self.interval = interval
+        self.segments = deque(maxlen=checkpoints)
+        self.breakpoints = set()
+        # Furthest cycle executed for real; behind it, execution is a replay
+        self.frontier = cpu.cycles
+        # While replaying: the CPU's own event queue and console (put back at the frontier), and the events to inject
+        self.live_events = None
+        self.live_console = None
+        self.pending = []
+        self.position = 0
+        # RAM as the write log last saw it (for each write's old value), and SP when an interrupt was being delivered
+        self.shadow = bytearray(cpu.ram)
+        self.delivering = None
+        # One decoded entry per instruction, so every cycle is a place to stop
+        self.fusion = cpu.fusion
+        cpu.fusion = False
+        cpu.invalidate_all()
+        cpu.recorder = self
+        self.checkpoint()
+
+    def detach(self):
+        """Give the CPU back (at the frontier, so nothing is lost)"""
+
+        self.goto(self.frontier)
+        cpu = self.cpu
+        cpu.recorder = None
+        cpu.fusion = self.fusion
+        cpu.invalidate_all()
+
+    @property
+    def live(self):
+        return self.live_events is None
+
+    def horizon(self):
+        """Earliest cycle that can still be reached"""
+
+        return self.segments[0].snapshot.cycles
+
+    def checkpoint(self):
+        cpu = self.cpu
+        self.segments.append(Segment(Snapshot(bytes(cpu.state), cpu.pc, cpu.fl, cpu.cycles, cpu.halted,
+                                              cpu.interrupts_enabled)))
+
+    # Recorder hooks (see replay.py): log external events while live, ignore the ones being replayed
+
+    def key(self, cycle, value):
+        if self.live:
+            self.segments[-1].events.append((cycle, KEY, value))
+            # press_key writes 0xF4 right after this
+            self.log_write(cycle, KEY_ADDRESS, value & 0xFF)
+
+    def raised(self, cycle, n):
+        if self.live:
+            self.segments[-1].events.append((cycle, RAISE, n))
+
+    def delivered(self, cycle, n):
+        if self.live:
+            # The PC, FL and R0-R6 are about to be pushed below this
+            self.delivering = self.cpu.reg[SP]
+
+    def log_write(self, cycle, address, value=None):
+        """Log a write to RAM (value defaults to what is there now)"""
+
+        value = self.cpu.ram[address] if value is None else value
+        self.segments[-1].writes.append((cycle << 24) | (address << 16) | (self.shadow[address] << 8) | value)
+        self.shadow[address] = value
+
+    def go_live(self):
+        """Reached the frontier: hand the CPU its own events and console back"""
+
+        cpu = self.cpu
+        cpu.events = self.live_events
+        cpu.console = self.live_console
+        self.live_events = self.live_console = None
+        self.pending = []
+        cpu.next_event = 0
+        self.shadow[:] = cpu.ram
+
+    def arrive(self, cycles):
+        """
+        Everything that happens at a cycle count before its instruction runs:
+        replayed events, going live at the frontier, the checkpoint, then
+        CPU.service() (events due and interrupt delivery)
+        """
+
+        cpu = self.cpu
+
+        if not self.live:
+            # Logged events for this cycle go in first, exactly as they happened
+            pending = self.pending
+            while self.position < len(pending) and pending[self.position][0] <= cycles:
+                _, kind, value = pending[self.position]
+                if kind == KEY:
+                    cpu.ram_write(value, KEY_ADDRESS)
+                else:
+                    cpu.raise_interrupt(value)
+                self.position += 1
+            if cycles >= self.frontier:
+                self.go_live()
+
+        if self.live and cycles >= self.segments[-1].snapshot.cycles + self.interval:
+            self.checkpoint()
+
+        if cycles >= cpu.next_event:
+            cpu.next_event = cpu.service(cycles)
+            if self.delivering is not None:
+                for i in range(1, 10):
+                    self.log_write(cycles, (self.delivering - i) & 0xFF)
+                self.delivering = None
+
+    def execute(self, until, stop_at_breakpoints=False, hits=None):
+        """
+        Run instructions until the cycle count reaches `until`, the CPU halts
+        or faults, or (with stop_at_breakpoints) the PC lands on a breakpoint
+        after at least one instruction. The cycles at which the PC was on a
+        breakpoint are appended to `hits` if given. Returns the status.
+        """
+
+        cpu = self.cpu
+        ram = cpu.ram
+        reg = cpu.reg
+        decoded = cpu.decoded
+        breakpoints = self.breakpoints
+        start = cpu.cycles
+        cpu.fault = None
+
+        try:
+            while cpu.cycles < until and not cpu.halted:
+                cycles = cpu.cycles
+                self.arrive(cycles)
+                pc = cpu.pc
+
+                if pc in breakpoints:
+                    if hits is not None:
+                        hits.append(cycles)
+                    if stop_at_breakpoints and cycles != start:
+                        return BREAKPOINT
+
+                entry = decoded[pc]
+                if entry is None:
+                    entry = cpu.decode(pc)
+                handler, op_a, op_b, length, _ = entry
+                ir = ram[pc]
+                cpu.cycles += 1
+
+                if handler is None:
+                    cpu.halted = True
+                    break
+
+                handler(op_a, op_b)
+                if length:
+                    cpu.pc = (pc + length) & 0xFF
+
+                # Only these instructions write RAM
+                if self.live:
+                    if ir == PUSH or ir == CALL:
+                        self.log_write(cycles, reg[SP])
+                    elif ir == ST:
+                        self.log_write(cycles, reg[op_a])
+
+            # Stopped at `until`: take this cycle's events and interrupt now, so the state is the one a
+            # breakpoint here shows (arrive() does nothing more when execution carries on from it)
+            if not cpu.halted:
+                self.arrive(cpu.cycles)
+        except Halt:
+            cpu.halted = True
+        except Fault as e:
+            cpu.fault = str(e)
+        finally:
+            if self.live:
+                self.frontier = max(self.frontier, cpu.cycles)
+            cpu.console.flush()
+
+        return cpu.status()
+
+    # *** Forward ***
+
+    def run(self, max_cycles=None):
+        """Run until HLT, a fault, a breakpoint or max_cycles; returns the status (or BREAKPOINT)"""
+
+        until = sys.maxsize if max_cycles is None else self.cpu.cycles + max_cycles
+        return self.execute(until, stop_at_breakpoints=True)
+
+    def step(self, n=1):
+        return self.execute(self.cpu.cycles + n)
+
+    # *** Backward ***
+
+    def goto(self, cycle):
+        """
+        Put the machine in its state at a cycle count, between the horizon
+        and the frontier. Earlier cycles are reached by restoring a
+        checkpoint and replaying forward.
+        """
+
+        cpu = self.cpu
+
+        if not self.horizon() <= cycle <= self.frontier:
+            raise ValueError(f"cycle {cycle} is outside the recorded history "
+                             f"({self.horizon()}..{self.frontier})")
+
+        if cycle < cpu.cycles or cpu.fault is not None:
+            # The last checkpoint at or before the target, and every event logged from there on
+            index = max(i for i, segment in enumerate(self.segments) if segment.snapshot.cycles <= cycle)
+            segments = list(self.segments)[index:]
+
+            if self.live:
+                self.live_events = cpu.events
+                self.live_console = cpu.console
+                cpu.events = EventQueue()
+                cpu.console = Console(NullSink())
+
+            self.pending = [event for segment in segments for event in segment.events]
+            self.position = 0
+            cpu.restore(segments[0].snapshot)
+
+        self.execute(cycle)
+
+    def step_back(self, n=1):
+        """Go back n instructions (or to the horizon)"""
+
+        self.goto(max(self.horizon(), self.cpu.cycles - n))
+
+    def last_write(self, address, before=None):
+        """(cycle, old, new) of the last write to an address before a cycle (default: now), or None"""
+
+        before = self.cpu.cycles if before is None else before
+
+        for segment in reversed(self.segments):
+            if segment.snapshot.cycles >= before:
+                continue
+            for entry in reversed(segment.writes):
+                cycle = entry >> 24
+                if cycle < before and (entry >> 16) & 0xFF == address:
+                    return cycle, (entry >> 8) & 0xFF, entry & 0xFF
+
+        return None
+
+    def back_to_write(self, address):
+        """
+        Go back to the last write to an address: the PC is left on the
+        instruction that made it. Returns that (cycle, old, new), or None if
+        there was none in the history (the machine is then left alone).
+        """
+
+        write = self.last_write(address)
+
+        if write is not None:
+            self.goto(write[0])
+
+        return write
+
+    def reverse_continue(self):
+        """
+        Go back to the last time the PC was on a breakpoint. Checkpoints are
+        replayed one at a time, newest first. Returns the cycle, or None
+        (and goes to the horizon) if no breakpoint was hit in the history.
+        """
+
+        now = self.cpu.cycles
+
+        for segment in reversed(list(self.segments)):
+            begin = segment.snapshot.cycles
+            if begin >= now:
+                continue
+            hits = []
+            self.goto(begin)
+            self.execute(now, hits=hits)
+            hits = [cycle for cycle in hits if cycle < now]
+            if hits:
+                self.goto(hits[-1])
+                return hits[-1]
+            now = begin
+
+        self.goto(self.horizon())
+        return None
+
+
+class Shell(cmd.Cmd):
+    """Command loop around a TimeTravel"""
+
+    prompt = "(ls8) "
+
+    def __init__(self, tt):
+        super().__init__()
+        self.tt = tt
+
+    def show(self):
+        cpu = self.tt.cpu
+        ir = cpu.ram[cpu.pc]
+        regs = " ".join(f"R{i}={cpu.reg[i]:02X}" for i in range(8))
+        state = cpu.status() if cpu.halted or cpu.fault else ""
+        print(f"cycle {cpu.cycles}  PC={cpu.pc:02X} {NAMES.get(ir, f'{ir:08b}')}  FL={cpu.fl:03b}  {regs}  {state}")
+        if cpu.fault:
+            print(f"Fault: {cpu.fault}")
+
+    def address(self, arg):
+        return int(arg, 16) & 0xFF
+
+    def do_step(self, arg):
+        """step [N]: execute N instructions"""
+        self.tt.step(int(arg or 1))
+        self.show()
+
+    def do_continue(self, arg):
+        """continue: run to the next breakpoint, HLT or fault"""
+        self.tt.run()
+        self.show()
+
+    def do_back(self, arg):
+        """back [N]: step back N instructions"""
+        self.tt.step_back(int(arg or 1))
+        self.show()
+
+    def do_rcontinue(self, arg):
+        """rcontinue: run backwards to the previous breakpoint"""
+        if self.tt.reverse_continue() is None:
+            print("no breakpoint hit in the history")
+        self.show()
+
+    def do_rwrite(self, arg):
+        """rwrite ADDR: run back to the instruction that last wrote RAM[ADDR] (hex)"""
+        write = self.tt.back_to_write(self.address(arg))
+        if write is None:
+            print("no write to that address in the history")
+        else:
+            print(f"{write[1]:02X} -> {write[2]:02X}")
+        self.show()
+
+    def do_goto(self, arg):
+        """goto CYCLE: move to a cycle count in the history"""
+        try:
+            self.tt.goto(int(arg))
+        except ValueError as e:
+            print(e)
+        self.show()
+
+    def do_break(self, arg):
+        """break ADDR: toggle a breakpoint (hex); with no address, list them"""
+        if arg:
+            self.tt.breakpoints ^= {self.address(arg)}
+        print(" ".join(f"{pc:02X}" for pc in sorted(self.tt.breakpoints)) or "no breakpoints")
+
+    def do_mem(self, arg):
+        """mem ADDR [N]: show N bytes of RAM from ADDR (hex)"""
+        parts = arg.split()
+        start = self.address(parts[0])
+        count = int(parts[1]) if len(parts) > 1 else 16
+        print(" ".join(f"{self.tt.cpu.ram[(start + i) & 0xFF]:02X}" for i in range(count)))
+
+    def do_info(self, arg):
+        """info: history covered and memory held"""
+        tt = self.tt
+        writes = sum(len(segment.writes) for segment in tt.segments)
+        print(f"history {tt.horizon()}..{tt.frontier}, {len(tt.segments)} checkpoints, {writes} logged writes")
+
+    def do_quit(self, arg):
+        """quit"""
+        return True
+
+    do_s, do_c, do_b, do_rc, do_q = do_step, do_continue, do_back, do_rcontinue, do_quit
+    do_EOF = do_quit
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Debug an LS-8 program forwards and backwards")
+    parser.add_argument("program", help="path to the .ls8/.ls8b file, or .asm source")
+    parser.add_argument("--interval", type=int, default=INTERVAL,
+                        help="cycles between checkpoints (longest replay for a backward move)")
+    parser.add_argument("--checkpoints", type=int, default=CHECKPOINTS,
+                        help="checkpoints kept (history = interval * checkpoints cycles)")
+    args = parser.parse_args(argv[1:])
+
+    cpu = CPU()
+
+    if args.program.endswith(".asm"):
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "asm"))
+        import asm
+        with open(args.program) as source:
+            try:
+                cpu.load_program(asm.assemble(source))
+            except asm.AsmError as e:
+                print(e, file=sys.stderr)
+                return e.status
+    else:
+        cpu.load(args.program)
+
+    shell = Shell(TimeTravel(cpu, args.interval, args.checkpoints))
+    shell.show()
+    shell.cmdloop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
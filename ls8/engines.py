@@ -0,0 +1,8 @@
+from cpu import CPU
+from blocks import BlockCPU
+
+# Execution engines by the name used on the command line (--mode)
+MODES = {
+    "interp": CPU,
+    "blocks": BlockCPU,
+}
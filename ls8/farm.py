@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+"""
+Program farm: run many .ls8 programs over a pool of warm worker processes.
+
+Usage: farm.py [options] <directory | manifest.json>
+
+A directory runs every .ls8 file in it. A manifest is a JSON list of jobs:
+
+    [{"program": "examples/mult.ls8", "max_cycles": 10000, "input": "ab"}, ...]
+
+Relative program paths are resolved against the manifest's directory. A job's
+input is typed into the program as keyboard interrupts, one key each time the
+program is ready for the next. The report (JSON or CSV, chosen by the
+--report file extension) has one row per job with its output, exit state,
+cycle count and wall time.
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import functools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import image
+from cpu import CYCLE_LIMIT
+from engines import MODES
+from console import Console, CaptureSink
+
+# Instructions between checks for whether a program is ready for the next key of its input
+KEY_SLICE = 1000
+
+# Report columns, in CSV order
+FIELDS = ["program", "mode", "status", "cycles", "wall_time", "output", "error", "input"]
+
+
+def read_jobs(source, max_cycles, mode):
+    """
+    Build the job list from a directory of .ls8 files or a JSON manifest.
+    Jobs without their own max_cycles/mode get the command line defaults.
+    """
+
+    if os.path.isdir(source):
+        jobs = [{"program": os.path.join(source, name)}
+                for name in sorted(os.listdir(source)) if name.endswith(".ls8")]
+    else:
+        with open(source) as f:
+            jobs = json.load(f)
+
+        base = os.path.dirname(source)
+
+        for job in jobs:
+            job["program"] = os.path.join(base, job["program"])
+
+    for job in jobs:
+        job.setdefault("max_cycles", max_cycles)
+        job.setdefault("mode", mode)
+        job.setdefault("input", "")
+
+    return jobs
+
+
+@functools.lru_cache(maxsize=64)
+def assemble(source):
+    """
+    Assemble .asm source text in-process. Results are cached, so a worker
+    that gets the same source again skips the assembler.
+    """
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "asm"))
+    import asm
+
+    return asm.assemble(source)
+
+
+def load_job(cpu, job):
+    """
+    Load a job's program: "image" (.ls8b bytes), "source" (.asm text), or
+    "program" (a .ls8, .ls8b or .asm file).
+    """
+
+    if job.get("image") is not None:
+        cpu.load_program(image.parse_image(job["image"]))
+    elif job.get("source") is not None:
+        cpu.load_program(assemble(job["source"]))
+    elif job["program"].endswith(".asm"):
+        with open(job["program"]) as source:
+            cpu.load_program(assemble(source.read()))
+    else:
+        cpu.load(job["program"])
+
+
+def run_with_input(cpu, max_cycles, keys):
+    """
+    Run like CPU.run(max_cycles), typing the keys (bytes) in order. Between
+    slices of KEY_SLICE instructions, the next key is pressed if the
+    program can take it.
+    """
+
+    pending = deque(keys)
+    limit = None if max_cycles is None else cpu.cycles + max_cycles
+
+    while pending:
+        if cpu.can_take_key():
+            cpu.press_key(pending.popleft())
+
+        budget = KEY_SLICE if limit is None else min(KEY_SLICE, limit - cpu.cycles)
+
+        if budget <= 0:
+            return CYCLE_LIMIT
+
+        status = cpu.run(budget)
+
+        if status != CYCLE_LIMIT:
+            return status
+
+    return cpu.run(None if limit is None else max(0, limit - cpu.cycles))
+
+
+def run_job(job):
+    """
+    Run one job in this (already warm) worker and return its report row.
+    """
+
+    out = CaptureSink()
+    status = "faulted"
+    error = ""
+    cpu = MODES[job["mode"]]()
+    cpu.console = Console(out)
+
+    start = time.perf_counter()
+
+    try:
+        load_job(cpu, job)
+        status = run_with_input(cpu, job["max_cycles"], job["input"].encode("latin-1"))
+        error = cpu.fault or ""
+
+    except (Exception, SystemExit) as e:
+        # Bad .asm source (AsmError), a missing file, ...: this job's row says so and the rest still run
+        error = f"{type(e).__name__}: {e}"
+
+    wall_time = time.perf_counter() - start
+
+    return {
+        "program": job.get("program"),
+        "mode": job["mode"],
+        "status": status,
+        "cycles": cpu.cycles,
+        "wall_time": wall_time,
+        "output": out.getvalue(),
+        "error": error,
+        "input": job["input"],
+    }
+
+
+def run_farm(jobs, workers=None, chunksize=1):
+    """
+    Spread the jobs over a process pool and return the report rows in job order.
+    The workers import the emulator once and reuse it for every job they get.
+    """
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run_job, jobs, chunksize=chunksize))
+
+
+def write_report(rows, outputfile):
+    """
+    Write the rows as CSV if the file name ends in .csv, otherwise as JSON
+    ("-" is stdout).
+    """
+
+    f = sys.stdout if outputfile == "-" else open(outputfile, "w", newline="")
+
+    try:
+        if outputfile.endswith(".csv"):
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            json.dump(rows, f, indent=2)
+            f.write("\n")
+
+    finally:
+        if f is not sys.stdout:
+            f.close()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Run many LS-8 programs in parallel")
+    parser.add_argument("source", help="directory of .ls8 files or a JSON manifest")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes (default: one per core)")
+    parser.add_argument("--max-cycles", type=int, default=None,
+                        help="default per-job instruction limit")
+    parser.add_argument("--mode", choices=MODES, default="interp",
+                        help="default execution engine")
+    parser.add_argument("--chunksize", type=int, default=1,
+                        help="jobs handed to a worker at a time")
+    parser.add_argument("--report", default="-",
+                        help="report file, .csv or .json (default: JSON on stdout)")
+    args = parser.parse_args(argv[1:])
+
+    jobs = read_jobs(args.source, args.max_cycles, args.mode)
+    rows = run_farm(jobs, args.workers, args.chunksize)
+    write_report(rows, args.report)
+
+    # Non-zero exit if anything faulted
+    return 1 if any(row["status"] == "faulted" for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
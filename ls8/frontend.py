@@ -0,0 +1,148 @@
+"""
+Asyncio front end for interactive programs.
+
+The CPU runs in time slices of SLICE_CYCLES instructions. Between slices
+the event loop gets a turn, so stdin is read through loop.add_reader() with
+no blocking read and no polling. Each byte read becomes a key press: it is
+stored at 0xF4 and I1 is raised. A new key is only delivered once the
+previous one has been taken, which means I1 is no longer pending and no
+handler is running.
+
+When a slice ends with the CPU idle (see CPU.skip_idle), the front end
+awaits the next key, or the next wall-clock timer tick if there is one. It
+does not keep slicing through the idle loop.
+
+Other event sources can call Frontend.post(callback); the callback runs
+against the CPU between two slices.
+"""
+
+import os
+import sys
+import time
+import asyncio
+import contextlib
+from collections import deque
+
+from cpu import CYCLE_LIMIT
+
+# termios/tty are POSIX-only; without them stdin is read in its normal (line-buffered) mode
+try:
+    import tty
+    import termios
+except ImportError:
+    tty = termios = None
+
+# Instructions per slice between event-loop turns
+SLICE_CYCLES = 10000
+
+
+class Frontend:
+    """Drives one CPU from an asyncio event loop"""
+
+    def __init__(self, cpu, stdin=None, slice_cycles=SLICE_CYCLES):
+        self.cpu = cpu
+        self.stdin = sys.stdin if stdin is None else stdin
+        self.slice_cycles = slice_cycles
+        # Keys read but not yet delivered, and callbacks waiting for the next gap between slices
+        self.keys = deque()
+        self.posted = deque()
+        # Set whenever something arrives that an idle CPU should wake up for
+        self.wakeup = None
+
+    def key(self, value):
+        """Queue a key press (a byte value)"""
+
+        self.keys.append(value & 0xFF)
+        self.wakeup.set()
+
+    def post(self, callback):
+        """Run callback(cpu) between two slices (e.g. to raise a device interrupt)"""
+
+        self.posted.append(callback)
+        self.wakeup.set()
+
+    def read_stdin(self, fd):
+        data = os.read(fd, 1024)
+
+        if not data:
+            # End of input: nothing more will come from here
+            asyncio.get_running_loop().remove_reader(fd)
+            return
+
+        for value in data:
+            self.key(value)
+
+    def deliver(self):
+        """Hand queued events to the CPU"""
+
+        cpu = self.cpu
+
+        while self.posted:
+            self.posted.popleft()(cpu)
+
+        # One key at a time: the handler reads 0xF4, so the next key waits until it has run
+        if self.keys and cpu.can_take_key():
+            cpu.press_key(self.keys.popleft())
+
+    def idle_timeout(self):
+        """Seconds an idle CPU can wait before its wall-clock timer is due (None: only an event can wake it)"""
+
+        timer = self.cpu.timer
+
+        if timer is None or not timer.active or timer.seconds is None:
+            return None
+        if timer.due is None:
+            return 0
+
+        return max(0.0, timer.due - time.monotonic())
+
+    async def run(self):
+        """Run the CPU until it halts or faults, feeding it events; returns the status like CPU.run"""
+
+        cpu = self.cpu
+        loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        fd = None
+
+        with contextlib.ExitStack() as stack:
+            with contextlib.suppress(AttributeError, OSError, ValueError):
+                fd = self.stdin.fileno()
+
+            if fd is not None:
+                if termios is not None and os.isatty(fd):
+                    # Keys arrive as they are typed, not a line at a time
+                    saved = termios.tcgetattr(fd)
+                    stack.callback(termios.tcsetattr, fd, termios.TCSADRAIN, saved)
+                    tty.setcbreak(fd)
+
+                try:
+                    loop.add_reader(fd, self.read_stdin, fd)
+                    stack.callback(loop.remove_reader, fd)
+                except PermissionError:
+                    # A regular file (e.g. < input.txt) can't be watched, but reading it never blocks: queue it all
+                    while (data := os.read(fd, 65536)):
+                        for value in data:
+                            self.key(value)
+
+            while True:
+                self.deliver()
+                idle = cpu.idle_cycles
+                status = cpu.run(self.slice_cycles)
+
+                if status != CYCLE_LIMIT:
+                    return status
+
+                if cpu.idle_cycles != idle and not self.keys and not self.posted:
+                    # Nothing to do until an event arrives or the timer is due
+                    self.wakeup.clear()
+                    with contextlib.suppress(asyncio.TimeoutError):
+                        await asyncio.wait_for(self.wakeup.wait(), self.idle_timeout())
+                else:
+                    # Give the event loop its turn between slices
+                    await asyncio.sleep(0)
+
+
+def run(cpu, stdin=None, slice_cycles=SLICE_CYCLES):
+    """Run a CPU under a fresh event loop with keyboard input from stdin"""
+
+    return asyncio.run(Frontend(cpu, stdin, slice_cycles).run())
@@ -0,0 +1,107 @@
+import io
+import mmap
+import struct
+
+# *** Binary program image (.ls8b): a small header, the raw program bytes, then an optional symbol table ***
+#
+#   header   magic "LS8B", version, entry point, load address, flags (reserved),
+#            code length (2 bytes), symbol count (2 bytes), little-endian
+#   code     `code length` raw bytes, copied into RAM at the load address
+#   symbols  per symbol: address (1 byte), name length (1 byte), name (ASCII)
+
+MAGIC = b"LS8B"
+VERSION = 1
+HEADER = struct.Struct("<4sBBBBHH")
+
+
+class Image:
+    __slots__ = ("entry", "load_address", "code", "symbols")
+
+    def __init__(self, code, entry=0, load_address=0, symbols=None):
+        self.code = code
+        self.entry = entry
+        self.load_address = load_address
+        self.symbols = symbols or {}
+
+
+def write_image(file, code, entry=0, load_address=0, symbols=None):
+    """Write program bytes and an optional {name: address} symbol table to a binary file."""
+
+    symbols = symbols or {}
+
+    if load_address + len(code) > 256:
+        raise ValueError(f"program of {len(code)} bytes does not fit in RAM at {load_address:#04x}")
+
+    file.write(HEADER.pack(MAGIC, VERSION, entry, load_address, 0, len(code), len(symbols)))
+    file.write(bytes(code))
+
+    for name, address in symbols.items():
+        encoded = name.encode("ascii")
+        file.write(bytes((address & 0xFF, len(encoded))))
+        file.write(encoded)
+
+
+def is_image(path):
+    """True if the file starts with the image magic."""
+
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def read_header(file):
+    """Read and check the header; returns (entry, load address, code length, symbol count)."""
+
+    raw = file.read(HEADER.size)
+
+    if len(raw) != HEADER.size:
+        raise ValueError("truncated LS-8 image header")
+
+    magic, version, entry, load_address, flags, length, count = HEADER.unpack(raw)
+
+    if magic != MAGIC:
+        raise ValueError("not an LS-8 image")
+
+    if version != VERSION:
+        raise ValueError(f"unsupported LS-8 image version {version}")
+
+    if load_address + length > 256:
+        raise ValueError("LS-8 image does not fit in RAM")
+
+    return entry, load_address, length, count
+
+
+def read_symbols(file, count):
+    """Read `count` symbol table entries that follow the code."""
+
+    symbols = {}
+
+    for _ in range(count):
+        address, size = file.read(2)
+        symbols[file.read(size).decode("ascii")] = address
+
+    return symbols
+
+
+def read_image(path):
+    """Map an image file and return it as an Image."""
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        entry, load_address, length, count = read_header(mm)
+        code = mm.read(length)
+        symbols = read_symbols(mm, count)
+
+    return Image(code, entry, load_address, symbols)
+
+
+def parse_image(data):
+    """Parse image bytes already in memory (e.g. received over a socket) into an Image."""
+
+    f = io.BytesIO(data)
+    entry, load_address, length, count = read_header(f)
+    code = f.read(length)
+
+    if len(code) != length:
+        raise ValueError("truncated LS-8 image")
+
+    return Image(code, entry, load_address, read_symbols(f, count))
+
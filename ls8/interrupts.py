@@ -0,0 +1,116 @@
+"""
+Interrupt scheduling for the LS-8.
+
+External events (the timer, key presses, ...) sit in an EventQueue: a heap
+keyed by the cycle count at which each one fires. The run loop never looks at
+the queue or the clock directly; it only compares its cycle count with
+CPU.next_event, and CPU.service() pops whatever is due, delivers an
+interrupt if IM & IS allows one, and works out the next cycle to stop at.
+"""
+
+import time
+import heapq
+import itertools
+
+# R5 is the interrupt mask (IM), R6 the interrupt status (IS)
+IM = 5
+IS = 6
+
+# I0-I7 handler addresses live at 0xF8-0xFF
+VECTORS = 0xF8
+
+# Interrupt numbers
+TIMER = 0
+KEYBOARD = 1
+
+# Where the keyboard interrupt leaves the most recent key
+KEY_ADDRESS = 0xF4
+
+# How often (in instructions) a wall-clock timer looks at the clock
+POLL_CYCLES = 4096
+
+
+class EventQueue:
+    """
+    Pending events as (cycle, sequence, action) entries in a heap. An action
+    is called as action(cpu, cycle) once the CPU has executed at least that
+    many instructions; the sequence number keeps same-cycle events in the
+    order they were scheduled.
+    """
+
+    __slots__ = ("heap", "sequence")
+
+    def __init__(self):
+        self.heap = []
+        self.sequence = itertools.count()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, cycle, action):
+        heapq.heappush(self.heap, (cycle, next(self.sequence), action))
+
+    def next_cycle(self):
+        """Cycle of the earliest pending event, or None"""
+
+        return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, cycles):
+        """Remove and return the actions due at or before a cycle count, earliest first"""
+
+        heap = self.heap
+        due = []
+
+        while heap and heap[0][0] <= cycles:
+            due.append(heapq.heappop(heap)[2])
+
+        return due
+
+    def clear(self):
+        self.heap.clear()
+
+
+class Timer:
+    """
+    Raises I0 periodically: every `cycles` instructions, or every `seconds`
+    of wall time. A wall-clock timer is itself an event that reads the clock
+    every POLL_CYCLES instructions, so the run loop never calls time().
+    Setting `active` to False stops it at its next firing.
+    """
+
+    def __init__(self, cycles=None, seconds=None):
+        if (cycles is None) == (seconds is None):
+            raise ValueError("timer period must be given as either cycles or seconds")
+        if cycles is not None and cycles <= 0:
+            raise ValueError("timer period must be positive")
+
+        self.cycles = cycles
+        self.seconds = seconds
+        self.active = True
+        # Wall-clock deadline of the next tick (set on the first check)
+        self.due = None
+
+    def start(self, cpu):
+        """Schedule the first firing relative to the CPU's cycle count"""
+
+        cpu.events.push(cpu.cycles + (self.cycles or POLL_CYCLES), self)
+
+    def __call__(self, cpu, cycle):
+        if not self.active:
+            return
+
+        if self.cycles is not None:
+            cpu.raise_interrupt(TIMER)
+            cpu.events.push(cycle + self.cycles, self)
+            return
+
+        now = time.monotonic()
+
+        if self.due is None:
+            self.due = now + self.seconds
+        elif now >= self.due:
+            cpu.raise_interrupt(TIMER)
+            # Skip ticks that were missed rather than firing a burst of them
+            self.due = max(self.due + self.seconds, now)
+
+        cpu.events.push(cycle + POLL_CYCLES, self)
@@ -2,10 +2,130 @@
 
 """Main."""
 
+import os
 import sys
+import argparse
 from cpu import *
+from engines import MODES
+from profiler import profile
+from console import Console, FileSink
 
-cpu = CPU()
+parser = argparse.ArgumentParser(description="Run an LS-8 program")
+parser.add_argument("program", help="path to the .ls8/.ls8b file, or .asm source to assemble first")
+parser.add_argument("--mode", choices=MODES, default="interp",
+                    help="execution engine (default: interp)")
+parser.add_argument("--profile", action="store_true",
+                    help="count executions per opcode/PC and print a table to stderr")
+parser.add_argument("--profile-json", metavar="FILE",
+                    help="with --profile, also write the counts as JSON")
+parser.add_argument("--trace", metavar="FILE",
+                    help="record the last instructions into a binary trace file (read it with tracer.py)")
+parser.add_argument("--trace-records", type=int, default=65536, metavar="N",
+                    help="with --trace, how many instructions the ring buffer keeps (default: 65536)")
+parser.add_argument("--memoize", action="store_true",
+                    help="cache the results of pure subroutines and print hit/miss counts to stderr")
+parser.add_argument("--fusion-report", action="store_true",
+                    help="print how often each fused instruction pair ran to stderr")
+parser.add_argument("--interactive", action="store_true",
+                    help="feed keys typed on stdin to the program as keyboard interrupts")
+parser.add_argument("--output", metavar="FILE",
+                    help="write PRN/PRA output to FILE instead of stdout")
+timer = parser.add_mutually_exclusive_group()
+timer.add_argument("--timer-seconds", type=float, metavar="S",
+                   help="raise the timer interrupt every S seconds of wall time (default: 1)")
+timer.add_argument("--timer-cycles", type=int, metavar="N",
+                   help="raise the timer interrupt every N instructions instead (reproducible runs)")
+events = parser.add_mutually_exclusive_group()
+events.add_argument("--record", metavar="FILE",
+                    help="log the timer ticks and key presses with their cycle counts to FILE")
+events.add_argument("--replay", metavar="FILE",
+                    help="re-run a recorded session from its log: same events at the same cycles, no real I/O")
+args = parser.parse_args()
+if args.replay and args.interactive:
+    parser.error("--replay takes its input from the log, not --interactive")
 
-cpu.load()
-cpu.run()
\ No newline at end of file
+cpu = MODES[args.mode]()
+if args.timer_cycles is not None:
+    cpu.set_timer(cycles=args.timer_cycles)
+elif args.timer_seconds is not None:
+    cpu.set_timer(seconds=args.timer_seconds)
+if args.output:
+    cpu.console = Console(FileSink(open(args.output, "wb")))
+
+if args.program.endswith(".asm"):
+    # Assemble in-process and load the bytes directly
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "asm"))
+    import asm
+    with open(args.program) as source:
+        try:
+            cpu.load_program(asm.assemble(source))
+        except asm.AsmError as e:
+            print(e, file=sys.stderr)
+            sys.exit(e.status)
+else:
+    cpu.load(args.program)
+
+if args.memoize:
+    memo = cpu.memoize()
+
+# No limit, except that a replay stops where its recording did
+max_cycles = None
+if args.replay:
+    # Events come from the log at their recorded cycles: no timer, no keyboard, full speed
+    import replay
+    try:
+        replayer = replay.replay(cpu, replay.EventLog.load(args.replay))
+    except ValueError as e:
+        print(f"Cannot replay {args.replay}: {e}", file=sys.stderr)
+        sys.exit(1)
+    max_cycles = replayer.remaining(cpu)
+elif args.record:
+    import replay
+    log = replay.record(cpu)
+
+try:
+    if args.profile:
+        # The instrumented loop is separate so normal runs don't pay for it
+        prof = profile(cpu, max_cycles)
+        print(prof.table(), file=sys.stderr)
+        if args.profile_json:
+            with open(args.profile_json, "w") as f:
+                prof.dump_json(f)
+    elif args.trace:
+        # Compact records into an mmapped ring buffer instead of a printed line per instruction
+        import tracer
+        trace = tracer.TraceBuffer(args.trace_records, args.trace)
+        try:
+            status = tracer.run_traced(cpu, trace, max_cycles)
+        finally:
+            trace.close()
+    elif args.interactive:
+        # Asyncio front end: the CPU runs in slices between reads of stdin
+        import frontend
+        status = frontend.run(cpu)
+    else:
+        status = cpu.run(max_cycles)
+finally:
+    # Saved even if the run is interrupted (Ctrl-C is how a spin-loop program usually ends)
+    if args.record:
+        log.finish(cpu)
+        log.save(args.record)
+
+if args.memoize:
+    stats = memo.stats()
+    print(f"memo: {stats['hits']} hits, {stats['misses']} misses, {stats['impure_calls']} impure calls, "
+          f"{stats['saved_instructions']} instructions saved", file=sys.stderr)
+
+if args.fusion_report:
+    report = cpu.fusion_report()
+    for name, count in sorted(report.items(), key=lambda item: -item[1]):
+        print(f"fused {name:10} {count:10d}", file=sys.stderr)
+    if not report:
+        print("fused: no pairs ran", file=sys.stderr)
+
+if args.replay and replayer.check():
+    print(f"Replay diverged: {replayer.check()}", file=sys.stderr)
+
+if not args.profile and status == FAULTED:
+    print(f"Fault: {cpu.fault}", file=sys.stderr)
+    sys.exit(1)
@@ -0,0 +1,302 @@
+"""
+Memoization of pure subroutines (opt-in: CPU.memoize()).
+
+With memoization on, CALL goes through Memoizer.call. The first time a
+subroutine is called, and on every cache miss after that, its body is
+executed under observation, one instruction at a time, up to the RET that
+returns to the caller. Observation records:
+
+* which registers (and FL) the body reads before writing them: its inputs
+* which registers (and FL) it writes, and their final values
+* how deep it pushes, and the bytes it leaves in that stack frame
+
+A body is impure if it does anything else: a RAM access outside its own
+stack frame (LD, ST, POP past its frame), output, INT/IRET/HLT, DIV/MOD
+(division by zero halts), a write to IM, IS or SP other than through the
+stack instructions, or more than MAX_OBSERVE instructions. Observation then
+stops right there. Everything executed so far really happened, and the run
+loop carries on from that instruction. The target is remembered as impure
+and always called normally from then on.
+
+A miss makes the CALL, then leaves the body to an event action that runs
+at the same cycle, after anything else due then. There the cycle count is
+current, so the body's instructions are counted like any others.
+Observation stops at the cycle limit of the run, or when an event due in
+the middle of the body raises an interrupt. Execution then carries on
+normally from where it stopped, and nothing is cached.
+
+A pure body's results are cached in an LRU keyed by the target and the
+values of its inputs. A later call with the same inputs is a hit: the frame
+bytes, the written registers and FL are set in one dispatch and execution
+continues after the CALL. The inputs of a target are the union over every
+path observed. A key over that union fixes the path, so a hit gives exactly
+what running the body would. When a new path reads more registers, the
+target's old entries are dropped.
+
+A hit counts as one instruction. Every address an observed body ran from
+is marked as code, so a write there drops what is known about the targets
+whose bodies ran through it.
+"""
+
+from collections import OrderedDict
+
+from cpu import *
+
+# Cache entries kept (least recently used go first)
+CAPACITY = 4096
+
+# Longest body observed; anything longer is treated as impure
+MAX_OBSERVE = 100000
+
+# Bit for FL in read/write masks (registers are bits 0-7)
+FL_BIT = 8
+
+# What each allowed opcode reads and writes, as (reads A, reads B, writes A, reads FL, writes FL)
+EFFECTS = {
+    LDI: (False, False, True, False, False),
+    CMP: (True, True, False, False, True),
+    JMP: (True, False, False, False, False),
+    JEQ: (True, False, False, True, False),
+    JNE: (True, False, False, True, False),
+    PUSH: (True, False, False, False, False),
+    POP: (False, False, True, False, False),
+    CALL: (True, False, False, False, False),
+    RET: (False, False, False, False, False),
+}
+for opcode in ALU_OPS:
+    if opcode not in (CMP, DIV, MOD):
+        # Two-operand ALU ops read both and write A; INC/DEC/NOT read and write A
+        EFFECTS[opcode] = (True, (opcode >> 6) == 2, True, False, False)
+
+
+class Impure(Exception):
+    """Observation ran into something a cached result couldn't reproduce"""
+
+
+class Unfinished(Exception):
+    """Observation ran out of cycles, or an interrupt is about to be delivered"""
+
+
+class Memoizer:
+    """The memo cache and statistics for one CPU"""
+
+    def __init__(self, cpu, capacity=CAPACITY):
+        self.cpu = cpu
+        self.capacity = capacity
+        self.cache = OrderedDict()
+        # Per target: input registers (sorted, FL_BIT for FL) and a version bumped whenever they grow
+        self.inputs = {}
+        self.versions = {}
+        self.impure = set()
+        # Per RAM address: the targets whose observed bodies ran code there
+        self.covers = {}
+        # Bumped when the cache is emptied or code changes, so an observation that saw that is not stored
+        self.generation = 0
+        # The CPU's own CALL, for impure targets and for calls made inside an observed body
+        self.raw_call = cpu.call
+        self.hits = 0
+        self.misses = 0
+        self.impure_calls = 0
+        # Instructions hits didn't have to execute
+        self.saved = 0
+
+    def clear(self):
+        self.cache.clear()
+        self.inputs.clear()
+        self.versions.clear()
+        self.impure.clear()
+        self.covers.clear()
+        self.generation += 1
+
+    def forget(self, address):
+        """The code at an address changed: drop what is known about every target whose body ran there"""
+
+        targets = self.covers.pop(address, None)
+
+        if targets:
+            for target in targets:
+                self.inputs.pop(target, None)
+                self.impure.discard(target)
+                # Entries under the old version can't be looked up any more (they age out of the LRU)
+                self.versions[target] = self.versions.get(target, 0) + 1
+            self.generation += 1
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "impure_calls": self.impure_calls,
+            "saved_instructions": self.saved,
+            "entries": len(self.cache),
+            "pure_targets": sorted(set(self.inputs) - self.impure),
+            "impure_targets": sorted(self.impure),
+        }
+
+    def key(self, target, values, fl):
+        """Cache key for a call to target with these registers and FL"""
+
+        return (target, self.versions.get(target, 0),
+                tuple(fl if r == FL_BIT else values[r] for r in self.inputs.get(target, ())))
+
+    # Installed as the CPU's CALL handler
+    def call(self, op_a, op_b):
+        cpu = self.cpu
+        reg = cpu.reg
+        target = reg[op_a]
+
+        if target in self.impure:
+            self.impure_calls += 1
+            self.raw_call(op_a, op_b)
+            return
+
+        entry = self.cache.get(self.key(target, reg, cpu.fl))
+
+        if entry is None:
+            self.misses += 1
+            start = bytes(reg)
+            fl = cpu.fl
+            # SP before the CALL: the body returns when SP is back here
+            top = reg[SP]
+            self.raw_call(op_a, op_b)
+
+            # The body runs from service(), where the cycle count is current, after anything else due at this cycle
+            def observe_next(cpu, cycle):
+                cpu.events.push(cycle, lambda cpu, cycle: self.observe(target, start, fl, top, cycle))
+
+            cpu.schedule(0, observe_next)
+            return
+
+        self.hits += 1
+        self.cache.move_to_end(entry[0])
+        _, registers, fl, frame, count = entry
+        sp = reg[SP]
+        write = cpu.ram_write
+        # The return address the CALL would push, then what the body left below it
+        write(cpu.pc + 2, sp - 1)
+        for depth, value in enumerate(frame, 2):
+            write(value, sp - depth)
+        for r, value in registers:
+            reg[r] = value
+        if fl is not None:
+            cpu.fl = fl
+        cpu.pc = (cpu.pc + 2) & 0xFF
+        self.saved += count
+
+    def observe(self, target, start, start_fl, top, cycle):
+        """
+        Event action: run the body of the call just made, instruction by
+        instruction from this cycle, caching the result if it turns out pure
+        """
+
+        cpu = self.cpu
+        ram = cpu.ram
+        reg = cpu.reg
+
+        # An interrupt was delivered since the CALL: the body runs normally, unobserved
+        if cpu.pc != target or reg[SP] != (top - 1) & 0xFF:
+            return
+
+        dispatch = cpu.dispatch
+        events = cpu.events
+        code_map = cpu.code_map
+        covers = self.covers
+        generation = self.generation
+        limit = cpu.run_limit
+        following = events.next_cycle()
+        stop = limit if following is None else min(following, limit)
+        read = written = 0
+        deepest = 1
+        count = 0
+
+        try:
+            while True:
+                if cycle + count >= stop:
+                    if cycle + count >= limit:
+                        raise Unfinished
+                    # An event falls inside the body: fire it here, then carry on unless it raised an interrupt
+                    cpu.cycles = cycle + count
+                    status = reg[IS]
+                    for action in events.pop_due(cpu.cycles):
+                        action(cpu, cpu.cycles)
+                    if reg[IS] != status:
+                        raise Unfinished
+                    following = events.next_cycle()
+                    stop = limit if following is None else min(following, limit)
+                    continue
+                count += 1
+                if count > MAX_OBSERVE:
+                    raise Impure
+                pc = cpu.pc
+                ir = ram[pc]
+                a = ram[(pc + 1) & 0xFF]
+                b = ram[(pc + 2) & 0xFF]
+                effects = EFFECTS.get(ir)
+                if effects is None or not operands_ok(ir, a, b):
+                    raise Impure
+                reads_a, reads_b, writes_a, reads_fl, writes_fl = effects
+                depth = (top - reg[SP]) & 0xFF
+                # Stack instructions must stay inside the body's own frame (depth 1 is the return address)
+                if ir == POP and depth < 2 or ir == RET and depth < 1:
+                    raise Impure
+                if writes_a and a in (IM, IS, SP):
+                    raise Impure
+
+                # Read before written: an input
+                if reads_a and not written >> a & 1:
+                    read |= 1 << a
+                if reads_b and not written >> b & 1:
+                    read |= 1 << b
+                if reads_fl and not written >> FL_BIT & 1:
+                    read |= 1 << FL_BIT
+
+                if ir == CALL:
+                    # Calls inside the body are observed as part of it, not looked up on their own
+                    self.raw_call(a, b)
+                else:
+                    dispatch[ir](a, b)
+                if not ir & 0b00010000:
+                    cpu.pc = (pc + (ir >> 6) + 1) & 0xFF
+
+                # The bytes just run are now code this target depends on: a write there calls forget()
+                for address in range(pc, pc + (ir >> 6) + 1):
+                    address &= 0xFF
+                    code_map[address] = 1
+                    covers.setdefault(address, set()).add(target)
+
+                if writes_a:
+                    written |= 1 << a
+                if writes_fl:
+                    written |= 1 << FL_BIT
+                depth = (top - reg[SP]) & 0xFF
+                if depth > deepest:
+                    deepest = depth
+                if ir == RET and depth == 0:
+                    break
+        except Impure:
+            # Leave the PC on the instruction that wasn't run; the run loop takes it from here
+            self.impure.add(target)
+            cpu.cycles = cycle + count - 1
+            return
+        except Unfinished:
+            cpu.cycles = cycle + count
+            return
+
+        cpu.cycles = cycle + count
+
+        if generation != self.generation:
+            return
+
+        # Inputs are every register any observed path read first; a wider set makes the old entries unreachable
+        inputs = set(self.inputs.get(target, ())) | {r for r in range(FL_BIT + 1) if read >> r & 1}
+        if tuple(sorted(inputs)) != self.inputs.get(target):
+            self.inputs[target] = tuple(sorted(inputs))
+            self.versions[target] = self.versions.get(target, 0) + 1
+
+        key = self.key(target, start, start_fl)
+        registers = tuple((r, reg[r]) for r in range(8) if written >> r & 1)
+        fl = cpu.fl if written >> FL_BIT & 1 else None
+        frame = bytes(ram[(top - depth) & 0xFF] for depth in range(2, deepest + 1))
+        self.cache[key] = (key, registers, fl, frame, count)
+
+        if len(self.cache) > self.capacity:
+            self.cache.popitem(last=False)
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+
+"""
+Symmetric multi-core LS-8: several cores, one OS process each, sharing one
+256-byte RAM.
+
+Usage: multicore.py [options] <program.ls8 | program.ls8b | program.asm>
+
+The RAM is a multiprocessing.shared_memory segment. Every core maps it and
+has its own registers, PC, FL, interrupt state, timer and console. All cores
+start at the program's entry point, and each gets its own stack:
+
+    core n starts with SP = 0xF4 - n * stack_size
+
+Three instructions exist only on these cores (a plain CPU faults on them):
+
+    CID rA       rA = this core's number (0 .. cores - 1)
+    TAS rA, rB   atomically: rA = RAM[rB], and RAM[rB] = 1 if it was 0
+    IPI rA, rB   raise interrupt rB & 7 on core rA
+
+TAS is a spinlock's acquire: the lock is taken when rA comes back 0, and
+released with a plain ST of 0. Every TAS runs under one lock shared by all
+cores. It only writes a byte it saw as 0, so a release can't be lost.
+
+An IPI to another core sets a bit in that core's mailbox, a byte stored after
+the RAM in the shared segment. Each core checks its mailbox every
+MAILBOX_POLL instructions and raises what it finds like a device interrupt.
+An IPI a core sends to itself is raised at once.
+
+Limitations: a core only drops its own decoded entries when it writes code,
+so code must not be changed while other cores may run it. There is no idle
+skipping, because a loop that looks idle may be waiting for another core.
+Only the interpreter engine runs on a core.
+
+The report gives each core's status, instruction count and MIPS, then the
+total across cores, to measure how a workload scales with the host's cores.
+"""
+
+import os
+import sys
+import time
+import queue
+import argparse
+import multiprocessing
+from multiprocessing import shared_memory
+
+from cpu import *
+from farm import load_job
+from console import Console, CaptureSink
+
+# Stack bytes per core (each interrupt needs 9 of them)
+STACK_SIZE = 16
+
+# Instructions between checks of a core's mailbox
+MAILBOX_POLL = 1024
+
+
+class Core(CPU):
+    """
+    One core of a multi-core machine. The RAM is a view of the shared
+    segment; the registers stay private to the core.
+    """
+
+    __slots__ = ("core_id", "cores", "mailboxes", "lock")
+
+    def __init__(self, core_id, cores, shared, lock, stack_size=STACK_SIZE):
+        super().__init__()
+        self.core_id = core_id
+        self.cores = cores
+        # RAM, then one mailbox byte per core (self.state keeps only the registers in use)
+        self.ram = shared[:256]
+        self.mailboxes = shared[256:256 + cores]
+        self.lock = lock
+        self.reg[SP] = STACK_START - core_id * stack_size
+        self.dispatch[CID] = self.cid
+        self.dispatch[TAS] = self.tas
+        self.dispatch[IPI] = self.ipi
+        self.events.push(MAILBOX_POLL, poll_mailbox)
+
+    # Load this core's number into register A
+    def cid(self, op_a, op_b):
+        self.reg[op_a] = self.core_id
+
+    # Test-and-set the byte at the address in register B, leaving its old value in register A
+    def tas(self, op_a, op_b):
+        address = self.reg[op_b]
+        with self.lock:
+            old = self.ram[address]
+            if not old:
+                self.ram_write(1, address)
+        self.reg[op_a] = old
+
+    # Raise interrupt number (register B) on the core numbered in register A
+    def ipi(self, op_a, op_b):
+        target = self.reg[op_a]
+        n = self.reg[op_b] & 7
+        if target >= self.cores:
+            raise Fault(f"IPI to core {target} at {self.pc:#04x}, but there are only {self.cores} cores")
+        if target == self.core_id:
+            self.raise_interrupt(n)
+            return
+        with self.lock:
+            self.mailboxes[target] |= 1 << n
+
+    # Other cores can change RAM at any moment: never treat a loop as idle
+    def skip_idle(self, cycles, stop, wait=False):
+        return cycles
+
+    # Give the shared segment back (no view of it may outlive the core)
+    def detach(self):
+        self.ram.release()
+        self.mailboxes.release()
+
+
+def poll_mailbox(core, cycle):
+    """Event action: raise the interrupts other cores sent since the last poll"""
+
+    mailboxes = core.mailboxes
+    i = core.core_id
+
+    if mailboxes[i]:
+        with core.lock:
+            bits = mailboxes[i]
+            mailboxes[i] = 0
+        for n in range(8):
+            if bits >> n & 1:
+                core.raise_interrupt(n)
+
+    core.events.push(cycle + MAILBOX_POLL, poll_mailbox)
+
+
+def run_core(name, lock, start, results, core_id, settings):
+    """
+    Process body for one core: attach to the shared segment, wait for the
+    other cores, run, and put the core's report row on the results queue.
+    """
+
+    segment = shared_memory.SharedMemory(name)
+    out = CaptureSink()
+    row = {"core": core_id, "status": FAULTED, "cycles": 0, "wall_time": 0.0, "output": "", "error": ""}
+    core = None
+
+    try:
+        core = Core(core_id, settings["cores"], segment.buf, lock, settings["stack_size"])
+        core.console = Console(out)
+        core.pc = settings["entry"]
+        if settings["timer_cycles"] is not None:
+            core.set_timer(cycles=settings["timer_cycles"])
+        elif settings["timer_seconds"] is not None:
+            core.set_timer(seconds=settings["timer_seconds"])
+
+        # Everyone starts the clock together
+        start.wait()
+        began = time.perf_counter()
+        row["status"] = core.run(settings["max_cycles"])
+        row["wall_time"] = time.perf_counter() - began
+        row["error"] = core.fault or ""
+
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+        start.abort()
+
+    finally:
+        if core is not None:
+            row["cycles"] = core.cycles
+            core.detach()
+        segment.close()
+
+    row["output"] = out.getvalue()
+    results.put(row)
+
+
+class Machine:
+    """
+    A program and the settings to run it on `cores` cores. run() creates the
+    shared RAM, starts one process per core and returns their report rows;
+    the RAM as the cores left it is kept in `ram`.
+    """
+
+    def __init__(self, cores=2, stack_size=STACK_SIZE, timer_cycles=None, timer_seconds=None):
+        if cores < 1 or cores * stack_size > STACK_START:
+            raise ValueError(f"{cores} cores with {stack_size}-byte stacks don't fit below {STACK_START:#04x}")
+
+        self.cores = cores
+        self.stack_size = stack_size
+        self.timer_cycles = timer_cycles
+        self.timer_seconds = timer_seconds
+        self.image = bytes(256)
+        self.entry = 0
+        self.ram = None
+
+    def load(self, program):
+        """Load a .ls8, .ls8b or .asm file the way a single CPU would"""
+
+        cpu = CPU()
+        load_job(cpu, {"program": program})
+        self.image = bytes(cpu.ram)
+        self.entry = cpu.pc
+
+    def run(self, max_cycles=None):
+        """Run every core until it halts, faults or uses up max_cycles; returns one row per core"""
+
+        bottom = STACK_START - self.cores * self.stack_size
+        if any(self.image[bottom:STACK_START]):
+            raise ValueError(f"the program reaches into the core stacks at {bottom:#04x}-{STACK_START - 1:#04x}"
+                             " (use fewer cores or smaller stacks)")
+
+        segment = shared_memory.SharedMemory(create=True, size=256 + self.cores)
+        lock = multiprocessing.Lock()
+        start = multiprocessing.Barrier(self.cores)
+        results = multiprocessing.Queue()
+        settings = {
+            "cores": self.cores,
+            "stack_size": self.stack_size,
+            "entry": self.entry,
+            "max_cycles": max_cycles,
+            "timer_cycles": self.timer_cycles,
+            "timer_seconds": self.timer_seconds,
+        }
+        rows = {}
+
+        try:
+            segment.buf[:256] = self.image
+            segment.buf[256:256 + self.cores] = bytes(self.cores)
+            # Daemonic, so no core outlives an interrupted run
+            processes = [multiprocessing.Process(target=run_core,
+                                                 args=(segment.name, lock, start, results, core_id, settings),
+                                                 daemon=True)
+                         for core_id in range(self.cores)]
+            for process in processes:
+                process.start()
+
+            # Collect rows while any core is still alive (one that died without reporting gets a row below)
+            while len(rows) < self.cores:
+                try:
+                    row = results.get(timeout=0.1)
+                    rows[row["core"]] = row
+                except queue.Empty:
+                    if not any(process.is_alive() for process in processes) and results.empty():
+                        break
+
+            for process in processes:
+                process.join()
+
+            self.ram = bytes(segment.buf[:256])
+
+        finally:
+            segment.close()
+            segment.unlink()
+
+        for core_id, process in enumerate(processes):
+            rows.setdefault(core_id, {"core": core_id, "status": FAULTED, "cycles": 0, "wall_time": 0.0,
+                                      "output": "", "error": f"core process exited with code {process.exitcode}"})
+
+        return [rows[core_id] for core_id in range(self.cores)]
+
+
+def report(rows):
+    """Per-core and total instruction counts and MIPS"""
+
+    lines = [f"{'core':>4} {'status':12} {'instructions':>14} {'seconds':>9} {'MIPS':>8}"]
+
+    for row in rows:
+        mips = row["cycles"] / row["wall_time"] / 1e6 if row["wall_time"] else 0.0
+        lines.append(f"{row['core']:4d} {row['status']:12} {row['cycles']:14d} {row['wall_time']:9.3f} {mips:8.2f}")
+        if row["error"]:
+            lines.append(f"     {row['error']}")
+
+    total = sum(row["cycles"] for row in rows)
+    # The cores run side by side: the machine took as long as its slowest core
+    wall_time = max(row["wall_time"] for row in rows)
+    mips = total / wall_time / 1e6 if wall_time else 0.0
+    lines.append(f"{'all':>4} {'':12} {total:14d} {wall_time:9.3f} {mips:8.2f}")
+
+    return "\n".join(lines)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Run an LS-8 program on several cores sharing one RAM")
+    parser.add_argument("program", help="path to the .ls8/.ls8b file, or .asm source to assemble first")
+    parser.add_argument("--cores", type=int, default=os.cpu_count() or 1,
+                        help="cores, one process each (default: one per host core)")
+    parser.add_argument("--max-cycles", type=int, default=None,
+                        help="instruction limit per core")
+    parser.add_argument("--stack-size", type=int, default=STACK_SIZE,
+                        help=f"stack bytes per core (default: {STACK_SIZE})")
+    timer = parser.add_mutually_exclusive_group()
+    timer.add_argument("--timer-seconds", type=float, metavar="S",
+                       help="raise each core's timer interrupt every S seconds of wall time (default: 1)")
+    timer.add_argument("--timer-cycles", type=int, metavar="N",
+                       help="raise each core's timer interrupt every N of its instructions instead")
+    parser.add_argument("--quiet", action="store_true",
+                        help="don't print the per-core report to stderr")
+    args = parser.parse_args(argv[1:])
+
+    try:
+        machine = Machine(args.cores, args.stack_size, args.timer_cycles, args.timer_seconds)
+        machine.load(args.program)
+        rows = machine.run(args.max_cycles)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # Each core's output in turn, core 0 first
+    for row in rows:
+        sys.stdout.write(row["output"])
+    sys.stdout.flush()
+
+    if not args.quiet:
+        print(report(rows), file=sys.stderr)
+
+    # Non-zero exit if any core faulted
+    return 1 if any(row["status"] == FAULTED for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,154 @@
+import json
+from cpu import *
+
+# *** Execution profiler: a separate, instrumented copy of the run loop so CPU.run pays nothing ***
+
+
+class Profile:
+    """
+    Counts collected by profile(): executions per opcode and per PC, taken and
+    not-taken conditional branches per PC, calls and inclusive cycles per
+    subroutine address, and the deepest CALL nesting seen.
+    """
+
+    def __init__(self):
+        self.cycles = 0
+        self.by_opcode = {}
+        self.by_pc = {}
+        # Conditional branch PC -> [taken, not taken]
+        self.branches = {}
+        # Subroutine address -> number of calls, and cycles spent inside it (including nested calls)
+        self.calls = {}
+        self.call_cycles = {}
+        self.max_depth = 0
+
+    def as_dict(self):
+        return {
+            "cycles": self.cycles,
+            "max_call_depth": self.max_depth,
+            "by_opcode": {NAMES.get(op, f"{op:08b}"): n for op, n in self.by_opcode.items()},
+            "by_pc": {f"{pc:02X}": n for pc, n in sorted(self.by_pc.items())},
+            "branches": {f"{pc:02X}": {"taken": t, "not_taken": nt}
+                         for pc, (t, nt) in sorted(self.branches.items())},
+            "calls": {f"{addr:02X}": {"calls": n, "cycles": self.call_cycles.get(addr, 0)}
+                      for addr, n in sorted(self.calls.items())},
+        }
+
+    def dump_json(self, file):
+        json.dump(self.as_dict(), file, indent=2)
+        file.write("\n")
+
+    def table(self, top=20):
+        """Human-readable summary, hottest entries first."""
+
+        lines = [f"cycles: {self.cycles}   max call depth: {self.max_depth}", "",
+                 f"{'opcode':8} {'count':>10} {'%':>6}"]
+        total = self.cycles or 1
+
+        for op, n in sorted(self.by_opcode.items(), key=lambda item: -item[1]):
+            lines.append(f"{NAMES.get(op, f'{op:08b}'):8} {n:10d} {100 * n / total:6.1f}")
+
+        lines += ["", f"{'pc':8} {'count':>10} {'%':>6}"]
+
+        for pc, n in sorted(self.by_pc.items(), key=lambda item: -item[1])[:top]:
+            lines.append(f"{pc:02X}{'':6} {n:10d} {100 * n / total:6.1f}")
+
+        if self.branches:
+            lines += ["", f"{'branch':8} {'taken':>10} {'not taken':>10}"]
+
+            for pc, (taken, not_taken) in sorted(self.branches.items()):
+                lines.append(f"{pc:02X}{'':6} {taken:10d} {not_taken:10d}")
+
+        if self.calls:
+            lines += ["", f"{'routine':8} {'calls':>10} {'cycles':>10}"]
+
+            for addr, n in sorted(self.calls.items(), key=lambda item: -self.call_cycles.get(item[0], 0)):
+                lines.append(f"{addr:02X}{'':6} {n:10d} {self.call_cycles.get(addr, 0):10d}")
+
+        return "\n".join(lines)
+
+
+def profile(cpu, max_cycles=None, prof=None):
+    """
+    Run the CPU like CPU.run (same decode cache, same handlers) while
+    counting into a Profile, which is returned. Pass an existing Profile to
+    keep accumulating into it.
+    """
+
+    if prof is None:
+        prof = Profile()
+
+    if cpu.halted:
+        return prof
+
+    # Count real instructions, not fused pairs: decode without fusion for the duration
+    fusion = cpu.fusion
+    cpu.fusion = False
+    cpu.invalidate_all()
+    decoded = cpu.decoded
+    by_opcode = prof.by_opcode
+    by_pc = prof.by_pc
+    branches = prof.branches
+    calls = prof.calls
+    call_cycles = prof.call_cycles
+    # Open calls: (subroutine address, cycle count when it was entered)
+    stack = []
+    # Open activations per subroutine, so recursive calls only count their outermost activation's cycles
+    active = {}
+    cycles = cpu.cycles
+    start_cycles = cycles
+    limit = -1 if max_cycles is None else cycles + max_cycles
+    cpu.run_limit = sys.maxsize if max_cycles is None else limit
+
+    try:
+        while cycles != limit:
+            if cycles >= cpu.next_event:
+                cpu.next_event = cpu.service(cycles)
+                # Instructions an event ran itself (a memoized call's body) don't show in the counts
+                cycles = cpu.cycles
+                continue
+            pc = cpu.pc
+            entry = decoded[pc]
+            if entry is None:
+                entry = cpu.decode(pc)
+            handler, op_a, op_b, length, _ = entry
+            ir = cpu.ram[pc]
+            cycles += 1
+            by_opcode[ir] = by_opcode.get(ir, 0) + 1
+            by_pc[pc] = by_pc.get(pc, 0) + 1
+
+            if handler is None:
+                cpu.halted = True
+                break
+
+            if ir == JEQ or ir == JNE:
+                taken = bool(cpu.fl & FL_E) == (ir == JEQ)
+                counts = branches.setdefault(pc, [0, 0])
+                counts[0 if taken else 1] += 1
+            elif ir == CALL:
+                target = cpu.reg[op_a]
+                calls[target] = calls.get(target, 0) + 1
+                stack.append((target, cycles))
+                active[target] = active.get(target, 0) + 1
+                if len(stack) > prof.max_depth:
+                    prof.max_depth = len(stack)
+            elif ir == RET and stack:
+                target, entered = stack.pop()
+                active[target] -= 1
+                if not active[target]:
+                    call_cycles[target] = call_cycles.get(target, 0) + cycles - entered
+
+            handler(op_a, op_b)
+            cpu.pc = (cpu.pc + length) & 0xFF
+    except Halt:
+        cpu.halted = True
+    except Fault as e:
+        cpu.fault = str(e)
+    finally:
+        cpu.cycles = cycles
+        prof.cycles += cycles - start_cycles
+        cpu.fusion = fusion
+        cpu.invalidate_all()
+        cpu.console.flush()
+
+    return prof
@@ -0,0 +1,207 @@
+"""
+Deterministic record and replay of external events.
+
+The only things that make two runs of the same program differ are the
+events that come from outside: the wall-clock timer, key presses and other
+device interrupts. While recording, the CPU reports each of them to an
+EventLog (cpu.recorder), keyed by the cycle count at which it happened:
+
+    KEY      value written to 0xF4
+    RAISE    interrupt number raised
+    DELIVER  interrupt number delivered (kept to check the replay against)
+
+A replay removes the timer and puts the KEY and RAISE entries back on the
+CPU's event queue at the same cycle counts. The run is then reproduced with
+no clock and no input, at full emulator speed: idle loops are skipped
+straight to the next logged event. Each delivery is checked against the
+log; Replayer.check() reports the first mismatch.
+
+    log = record(cpu)        ...run with a real timer / keyboard...
+    log.finish(cpu); log.save("session.ls8r")
+
+    replayer = replay(other_cpu, EventLog.load("session.ls8r"))
+    other_cpu.run(replayer.remaining(other_cpu))
+
+Replays must use the same program and the same engine as the recording (the
+block engine only takes events between blocks).
+
+Log file: a header (magic "LS8R", version, CRC-32 of the RAM at the start,
+first and last cycle) then one 10-byte entry per event: cycle (8 bytes),
+kind, value.
+"""
+
+import zlib
+import struct
+
+from interrupts import KEY_ADDRESS
+
+MAGIC = b"LS8R"
+VERSION = 1
+HEADER = struct.Struct("<4sBxxxIQQ")
+ENTRY = struct.Struct("<QBB")
+
+# Entry kinds
+KEY = 0
+RAISE = 1
+DELIVER = 2
+
+
+class EventLog:
+    """
+    (cycle, kind, value) entries in the order they happened. Installed as
+    cpu.recorder it appends one for every key, raise and delivery.
+    """
+
+    def __init__(self, ram_crc=0, start=0, end=0, entries=None):
+        self.ram_crc = ram_crc
+        self.start = start
+        self.end = end
+        self.entries = entries or []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def key(self, cycle, value):
+        self.entries.append((cycle, KEY, value))
+
+    def raised(self, cycle, n):
+        self.entries.append((cycle, RAISE, n))
+
+    def delivered(self, cycle, n):
+        self.entries.append((cycle, DELIVER, n))
+
+    def finish(self, cpu):
+        """Stop recording and note where the run ended"""
+
+        if cpu.recorder is self:
+            cpu.recorder = None
+        self.end = cpu.cycles
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.ram_crc, self.start, self.end))
+            f.write(b"".join(ENTRY.pack(*entry) for entry in self.entries))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+
+        if len(data) < HEADER.size:
+            raise ValueError("truncated LS-8 event log header")
+
+        magic, version, ram_crc, start, end = HEADER.unpack_from(data)
+
+        if magic != MAGIC:
+            raise ValueError("not an LS-8 event log")
+
+        if version != VERSION:
+            raise ValueError(f"unsupported LS-8 event log version {version}")
+
+        if (len(data) - HEADER.size) % ENTRY.size:
+            raise ValueError("truncated LS-8 event log")
+
+        return cls(ram_crc, start, end, list(ENTRY.iter_unpack(data[HEADER.size:])))
+
+
+class Replayer:
+    """
+    Feeds a log's KEY and RAISE entries back to a CPU as one chained event
+    (only the next entry's cycle is ever on the queue), and checks each
+    delivery against the log's DELIVER entries.
+    """
+
+    def __init__(self, log):
+        self.log = log
+        self.inputs = [entry for entry in log.entries if entry[1] != DELIVER]
+        self.expected = [entry for entry in log.entries if entry[1] == DELIVER]
+        self.position = 0
+        self.checked = 0
+        # First (expected entry, actual cycle, actual interrupt) that didn't match, if any
+        self.divergence = None
+
+    def start(self, cpu):
+        """Check the CPU is where the recording began, stop its timer and queue the first entry"""
+
+        if cpu.cycles != self.log.start or zlib.crc32(cpu.ram) != self.log.ram_crc:
+            raise ValueError("CPU state does not match the start of the recording")
+
+        cpu.set_timer()
+        cpu.recorder = self
+
+        if self.inputs:
+            cpu.schedule(self.inputs[0][0], self)
+
+    def remaining(self, cpu):
+        """Instructions left until the cycle count the recording ended at"""
+
+        return max(0, self.log.end - cpu.cycles)
+
+    def __call__(self, cpu, cycle):
+        inputs = self.inputs
+        position = self.position
+
+        # Everything logged for this cycle, in its original order
+        while position < len(inputs) and inputs[position][0] <= cycle:
+            _, kind, value = inputs[position]
+            if kind == KEY:
+                cpu.ram_write(value, KEY_ADDRESS)
+            else:
+                cpu.raise_interrupt(value)
+            position += 1
+
+        self.position = position
+
+        if position < len(inputs):
+            cpu.schedule(inputs[position][0], self)
+
+    # Recorder hooks: replayed events come back through raise_interrupt (nothing to log), deliveries are checked
+
+    def key(self, cycle, value):
+        pass
+
+    def raised(self, cycle, n):
+        pass
+
+    def delivered(self, cycle, n):
+        if self.divergence is not None:
+            return
+
+        expected = self.expected[self.checked] if self.checked < len(self.expected) else None
+
+        if expected is None or expected[0] != cycle or expected[2] != n:
+            self.divergence = (expected, cycle, n)
+
+        self.checked += 1
+
+    def check(self):
+        """None if every delivery so far matched the log and none are missing, else what went wrong"""
+
+        if self.divergence is not None:
+            expected, cycle, n = self.divergence
+            if expected is None:
+                return f"unexpected delivery of I{n} at cycle {cycle}"
+            return f"expected I{expected[2]} delivered at cycle {expected[0]}, got I{n} at cycle {cycle}"
+
+        if self.checked < len(self.expected):
+            cycle, _, n = self.expected[self.checked]
+            return f"I{n} was never delivered (recorded at cycle {cycle})"
+
+        return None
+
+
+def record(cpu):
+    """Start logging the CPU's external events; returns the EventLog"""
+
+    log = EventLog(zlib.crc32(cpu.ram), cpu.cycles)
+    cpu.recorder = log
+    return log
+
+
+def replay(cpu, log):
+    """Set the CPU up to replay a log; returns the Replayer (run it for replayer.remaining(cpu) instructions)"""
+
+    replayer = Replayer(log)
+    replayer.start(cpu)
+    return replayer
+
@@ -0,0 +1,106 @@
+"""
+Round-robin scheduler for many CPUs in one process.
+
+Each CPU is wrapped in a Task with an optional total cycle budget. The
+scheduler repeatedly gives the task at the front of the queue one quantum
+of instructions with CPU.run(quantum). A task that halts, faults or uses up
+its budget leaves the queue; every other task goes to the back. No guest can
+hold the process for longer than one quantum, however it behaves.
+
+    sched = Scheduler(quantum=2000)
+    for path in paths:
+        cpu = CPU()
+        cpu.load(path)
+        sched.add(cpu, budget=1_000_000, name=path)
+    for task in sched.run():
+        print(task.name, task.status, task.cpu.cycles)
+"""
+
+from collections import deque
+
+from cpu import CYCLE_LIMIT
+
+# Instructions a task runs before the next one gets its turn
+QUANTUM = 1000
+
+
+class Task:
+    """One guest under the scheduler"""
+
+    __slots__ = ("cpu", "name", "budget", "used", "status", "slices")
+
+    def __init__(self, cpu, budget=None, name=None):
+        self.cpu = cpu
+        self.name = name
+        # Total instructions this task may run (None = no limit), and how many it has run so far
+        self.budget = budget
+        self.used = 0
+        # CYCLE_LIMIT while it can still run, then HALTED/FAULTED (or CYCLE_LIMIT with the budget used up)
+        self.status = CYCLE_LIMIT
+        self.slices = 0
+
+    @property
+    def done(self):
+        return self.status != CYCLE_LIMIT or (self.budget is not None and self.used >= self.budget)
+
+
+class Scheduler:
+    """Runs tasks in turn, one quantum each, until all of them are done"""
+
+    def __init__(self, quantum=QUANTUM):
+        self.quantum = quantum
+        self.ready = deque()
+        self.finished = []
+
+    def __len__(self):
+        return len(self.ready)
+
+    def add(self, cpu, budget=None, name=None):
+        """Queue a CPU (already loaded) and return its Task"""
+
+        task = Task(cpu, budget, name)
+        self.ready.append(task)
+        return task
+
+    def run_slice(self):
+        """
+        Give the next task one quantum. Returns the task, or None once
+        nothing is left to run.
+        """
+
+        if not self.ready:
+            return None
+
+        task = self.ready.popleft()
+        cpu = task.cpu
+        quantum = self.quantum
+
+        if task.budget is not None:
+            quantum = min(quantum, task.budget - task.used)
+
+        before = cpu.cycles
+        task.status = cpu.run(quantum)
+        # A fused pair or a compiled block can run a little past the quantum; the budget counts what really ran
+        task.used += cpu.cycles - before
+        task.slices += 1
+
+        if task.done:
+            self.finished.append(task)
+        else:
+            self.ready.append(task)
+
+        return task
+
+    def run(self, max_slices=None):
+        """
+        Run slices until every task is done (or max_slices have run).
+        Returns the finished tasks in the order they finished.
+        """
+
+        slices = 0
+
+        while self.ready and (max_slices is None or slices < max_slices):
+            self.run_slice()
+            slices += 1
+
+        return self.finished
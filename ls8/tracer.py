@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+
+"""
+Binary execution trace: a fixed-size record per instruction in a ring buffer.
+
+    trace = TraceBuffer(65536, "run.ls8t")   # or TraceBuffer(65536) in memory
+    status = run_traced(cpu, trace)
+    trace.close()
+
+Each record is RECORD.size (16) bytes, written in place with pack_into:
+
+    cycle   8 bytes  cycle count after the instruction (0 marks an empty slot)
+    pc      1 byte   address of the instruction
+    ir      1 byte   opcode
+    a, b    2 bytes  the two operand bytes that follow it
+    reg     1 byte   register the instruction wrote (NO_REG if none)
+    value   1 byte   that register's new value
+    fl      1 byte   FL after the instruction
+    sp      1 byte   R7 after the instruction
+
+The buffer keeps the last `capacity` records and nothing else, so tracing
+can stay on for long runs. Backed by a file, it is an mmap of a 16-byte
+header followed by the slots. Records land in the page cache as they are
+written, so the file holds the last instructions even if the process dies.
+Readers put the slots back in order by cycle; no write pointer needs to
+survive.
+
+Run as a script, this module is the offline reader:
+
+    tracer.py run.ls8t [--last N] [--pc ADDR] [--op NAME] [--reg N] [--summary]
+"""
+
+import sys
+import mmap
+import struct
+import argparse
+from array import array
+from collections import namedtuple
+
+from cpu import *
+
+MAGIC = b"LS8T"
+VERSION = 1
+# magic, version, record size, capacity (padded so the records start 16-byte aligned)
+HEADER = struct.Struct("<4sBBxxI4x")
+RECORD = struct.Struct("<QBBBBBBBB")
+
+# reg value for instructions that wrote no register
+NO_REG = 0xFF
+
+# Records kept by default (1 MiB)
+CAPACITY = 65536
+
+Record = namedtuple("Record", "cycle pc ir a b reg value fl sp")
+
+
+class TraceBuffer:
+    """
+    Ring buffer of trace records: an array in memory, or an mmap of a trace
+    file when a path is given.
+    """
+
+    def __init__(self, capacity=CAPACITY, path=None):
+        self.capacity = capacity
+        self.path = path
+        # Total records written; the next one goes in slot written % capacity
+        self.written = 0
+        size = HEADER.size + capacity * RECORD.size
+
+        if path is None:
+            self.file = None
+            self.data = array("B", bytes(size))
+        else:
+            self.file = open(path, "w+b")
+            self.file.truncate(size)
+            self.data = mmap.mmap(self.file.fileno(), size)
+
+        HEADER.pack_into(self.data, 0, MAGIC, VERSION, RECORD.size, capacity)
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    def records(self):
+        """The records still held, oldest first"""
+
+        return decode(self.data, self.capacity)
+
+    def save(self, path):
+        """Write the buffer out as a trace file (for an in-memory buffer)"""
+
+        with open(path, "wb") as f:
+            f.write(self.data)
+
+    def close(self):
+        if self.file is not None:
+            self.data.flush()
+            self.data.close()
+            self.file.close()
+            self.file = None
+
+
+def decode(data, capacity):
+    """Unpack every used slot and sort them back into execution order"""
+
+    records = [Record._make(RECORD.unpack_from(data, HEADER.size + slot * RECORD.size))
+               for slot in range(capacity)]
+
+    return sorted((r for r in records if r.cycle), key=lambda r: r.cycle)
+
+
+def read_trace(path):
+    """Read a trace file; returns its records, oldest first"""
+
+    with open(path, "rb") as f:
+        data = f.read()
+
+    if len(data) < HEADER.size:
+        raise ValueError("truncated LS-8 trace header")
+
+    magic, version, size, capacity = HEADER.unpack_from(data)
+
+    if magic != MAGIC:
+        raise ValueError("not an LS-8 trace")
+
+    if version != VERSION or size != RECORD.size:
+        raise ValueError(f"unsupported LS-8 trace version {version}")
+
+    if len(data) < HEADER.size + capacity * size:
+        raise ValueError("truncated LS-8 trace")
+
+    return decode(data, capacity)
+
+
+def run_traced(cpu, buffer, max_cycles=None):
+    """
+    Run the CPU like CPU.run, recording every instruction into the buffer.
+    Returns the status like CPU.run. Fusion is off while tracing so each
+    instruction gets its own record. Idle loops skipped by skip_idle leave
+    no records.
+    """
+
+    if cpu.halted:
+        return HALTED
+
+    # One record per real instruction: decode without fusion for the duration
+    fusion = cpu.fusion
+    cpu.fusion = False
+    cpu.invalidate_all()
+    cpu.fault = None
+    decoded = cpu.decoded
+    ram = cpu.ram
+    reg = cpu.reg
+    data = buffer.data
+    pack = RECORD.pack_into
+    capacity = buffer.capacity
+    slot = buffer.written % capacity
+    written = buffer.written
+    base = HEADER.size
+    size = RECORD.size
+    cycles = cpu.cycles
+    limit = sys.maxsize if max_cycles is None else cycles + max_cycles
+    cpu.run_limit = limit
+
+    try:
+        while cycles < limit:
+            if cycles >= cpu.next_event:
+                stop = min(cpu.service(cycles), limit)
+                cycles = cpu.cycles
+                cycles = cpu.skip_idle(cycles, stop, max_cycles is None)
+                cpu.next_event = stop
+                continue
+            pc = cpu.pc
+            entry = decoded[pc]
+            if entry is None:
+                entry = cpu.decode(pc)
+            handler, op_a, op_b, length, _ = entry
+            ir = ram[pc]
+            cycles += 1
+
+            if handler is not None:
+                handler(op_a, op_b)
+                if length:
+                    cpu.pc = (pc + length) & 0xFF
+
+            if ir in WRITES_A:
+                pack(data, base + slot * size, cycles, pc, ir, ram[(pc + 1) & 0xFF], ram[(pc + 2) & 0xFF],
+                     op_a, reg[op_a], cpu.fl, reg[SP])
+            else:
+                pack(data, base + slot * size, cycles, pc, ir, ram[(pc + 1) & 0xFF], ram[(pc + 2) & 0xFF],
+                     NO_REG, 0, cpu.fl, reg[SP])
+            written += 1
+            slot += 1
+            if slot == capacity:
+                slot = 0
+
+            if handler is None:
+                cpu.halted = True
+                break
+    except Halt:
+        # The instruction that halted (e.g. DIV by zero) still counts, but its handler never finished: no record
+        cpu.halted = True
+    except Fault as e:
+        cpu.fault = str(e)
+    finally:
+        cpu.cycles = cycles
+        buffer.written = written
+        cpu.fusion = fusion
+        cpu.invalidate_all()
+        cpu.console.flush()
+
+    return cpu.status()
+
+
+def format_record(r):
+    """One line per record, in the spirit of CPU.trace()"""
+
+    name = NAMES.get(r.ir, f"{r.ir:08b}")
+    write = f"R{r.reg}={r.value:02X}" if r.reg != NO_REG else ""
+
+    return f"{r.cycle:10d}  {r.pc:02X}: {r.ir:02X} {r.a:02X} {r.b:02X}  {name:5} {write:6} FL={r.fl:03b} SP={r.sp:02X}"
+
+
+def select(records, pcs=None, ops=None, regs=None, first=None, last_cycle=None):
+    """Records matching every filter given (PC, opcode, register written, cycle range)"""
+
+    return [r for r in records
+            if (pcs is None or r.pc in pcs)
+            and (ops is None or r.ir in ops)
+            and (regs is None or r.reg in regs)
+            and (first is None or r.cycle >= first)
+            and (last_cycle is None or r.cycle <= last_cycle)]
+
+
+def summary(records):
+    """Counts by opcode and by PC, and the span of cycles the records cover"""
+
+    if not records:
+        return "empty trace"
+
+    by_opcode = {}
+    by_pc = {}
+
+    for r in records:
+        by_opcode[r.ir] = by_opcode.get(r.ir, 0) + 1
+        by_pc[r.pc] = by_pc.get(r.pc, 0) + 1
+
+    total = len(records)
+    lines = [f"records: {total}   cycles {records[0].cycle}..{records[-1].cycle}", "",
+             f"{'opcode':8} {'count':>10} {'%':>6}"]
+
+    for op, n in sorted(by_opcode.items(), key=lambda item: -item[1]):
+        lines.append(f"{NAMES.get(op, f'{op:08b}'):8} {n:10d} {100 * n / total:6.1f}")
+
+    lines += ["", f"{'pc':8} {'count':>10} {'%':>6}"]
+
+    for pc, n in sorted(by_pc.items(), key=lambda item: -item[1])[:20]:
+        lines.append(f"{pc:02X}{'':6} {n:10d} {100 * n / total:6.1f}")
+
+    lines += ["", "last: " + format_record(records[-1])]
+
+    return "\n".join(lines)
+
+
+def main(argv):
+    opcodes = {name: op for op, name in NAMES.items()}
+
+    parser = argparse.ArgumentParser(description="Decode, filter and summarize an LS-8 trace file")
+    parser.add_argument("trace", help="trace file written with ls8.py --trace")
+    parser.add_argument("--pc", action="append", type=lambda s: int(s, 16),
+                        help="only records at this address (hex, repeatable)")
+    parser.add_argument("--op", action="append", choices=sorted(opcodes), metavar="NAME",
+                        help="only this opcode (repeatable)")
+    parser.add_argument("--reg", action="append", type=int, choices=range(8),
+                        help="only records that wrote this register (repeatable)")
+    parser.add_argument("--from", dest="first", type=int, help="first cycle")
+    parser.add_argument("--to", type=int, help="last cycle")
+    parser.add_argument("--last", type=int, default=None, help="only the last N matching records")
+    parser.add_argument("--summary", action="store_true", help="print counts instead of records")
+    args = parser.parse_args(argv[1:])
+
+    records = select(read_trace(args.trace),
+                     pcs=args.pc and set(args.pc),
+                     ops=args.op and {opcodes[name] for name in args.op},
+                     regs=args.reg and set(args.reg),
+                     first=args.first, last_cycle=args.to)
+
+    if args.last is not None:
+        records = records[-args.last:]
+
+    if args.summary:
+        print(summary(records))
+    else:
+        for r in records:
+            print(format_record(r))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,74 @@
+import os
+import sys
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, "..", "ls8"))
+sys.path.insert(0, os.path.join(here, "..", "asm"))
+
+import asm  # noqa: E402
+from cpu import CPU, HALTED  # noqa: E402
+from console import Console, CaptureSink  # noqa: E402
+
+PATCH = """
+    LDI R1,Sub
+    CALL R1
+    PRN R0
+    LDI R2,Sub
+    INC R2
+    INC R2
+    LDI R3,9
+    ST R2,R3             ; Sub now loads 9
+    CALL R1
+    PRN R0
+    HLT
+Sub:
+    LDI R0,5
+    RET
+"""
+
+BODY = """
+    LDI R0,3
+    LDI R1,Sub
+    CALL R1
+    PRN R0
+    HLT
+Sub:
+    INC R0
+    INC R0
+    ADD R0,R0
+    INC R0
+    DEC R0
+    RET
+"""
+
+
+def make_cpu(source, memoize):
+    out = CaptureSink()
+    cpu = CPU()
+    cpu.set_timer()
+    cpu.console = Console(out)
+    cpu.load_program(asm.assemble(source))
+    memo = cpu.memoize() if memoize else None
+    return cpu, memo, out
+
+
+def test_patched_subroutine_is_not_served_from_the_cache():
+    cpu, memo, out = make_cpu(PATCH, True)
+    assert cpu.run() == HALTED
+    assert out.getvalue() == "5\n9\n"
+
+
+def test_observed_body_counts_against_the_budget():
+    for budget in range(1, 16):
+        plain, _, _ = make_cpu(BODY, False)
+        memoized, _, _ = make_cpu(BODY, True)
+        assert plain.run(budget) == memoized.run(budget)
+        assert (plain.cycles, plain.pc, bytes(plain.state)) == (memoized.cycles, memoized.pc, bytes(memoized.state))
+
+
+def test_target_without_inputs_is_reported_pure():
+    source = PATCH.replace("ST R2,R3", "PRN R3")
+    cpu, memo, _ = make_cpu(source, True)
+    cpu.run()
+    assert memo.stats()["pure_targets"] == [asm.assemble(source).symbols["SUB"]]
+    assert memo.hits == 1
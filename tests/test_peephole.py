@@ -0,0 +1,35 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "asm"))
+
+import asm  # noqa: E402
+
+
+def count_ldis(source):
+    program = asm.assemble(source, optimize=True)
+    return program.code.count(asm.CODES["LDI"])
+
+
+def test_repeated_is_clear_is_kept():
+    # Each LDI R6,0 acknowledges whatever interrupts were raised since the last one
+    source = """
+        LDI R6,0
+        LDI R0,1
+        PRN R0
+        LDI R6,0
+        PRN R0
+        HLT
+    """
+    assert count_ldis(source) == 3
+
+
+def test_redundant_ldi_still_removed():
+    source = """
+        LDI R0,1
+        PRN R0
+        LDI R0,1
+        PRN R0
+        HLT
+    """
+    assert count_ldis(source) == 1